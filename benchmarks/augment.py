@@ -0,0 +1,54 @@
+"""
+Augmentation throughput, in images per second, by stage and worker count,
+to compare with training throughput (printed by train_network each epoch).
+
+    python -m benchmarks.augment
+    python -m benchmarks.augment --batch-sizes 64 256 --workers 1 2 4
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from benchmarks.layers import measure
+from src.augment import Augmenter
+
+STAGES = {
+    "affine": {},
+    "elastic": {"elastic_alpha": 34.0},
+    "noise": {"max_shift": 0.0, "max_rotation": 0.0, "noise_std": 0.1},
+    "all": {"elastic_alpha": 34.0, "noise_std": 0.1},
+}
+
+
+def run(batch_sizes, workers, warmup, repeats):
+    rng = np.random.RandomState(0)
+    results = {}
+    for N in batch_sizes:
+        X = rng.rand(N, 1, 28, 28).astype(np.float32)
+        for name, options in STAGES.items():
+            for num_workers in workers:
+                augmenter = Augmenter(num_workers=num_workers, **options)
+                batch = X.copy()
+                timing = measure(lambda: augmenter(batch), warmup, repeats)
+                augmenter.close()
+                key = f"{name}/N={N}/workers={num_workers}"
+                results[key] = N / (timing["median_us"] * 1e-6)
+                print(f"{key:32s} {results[key]:12.0f} images/s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Augmentation throughput")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args(argv)
+    run(args.batch_sizes, args.workers, args.warmup, args.repeats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
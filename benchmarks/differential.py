@@ -0,0 +1,476 @@
+"""
+Differential checks of the fast kernels against the frozen loop-based
+reference in src/reference.py, on randomized shapes, strides and padding.
+
+Every case runs forward + backward through the reference and through each
+registered fast backend (every conv algorithm in CONV_ALGORITHMS, the
+vectorized pooling, the fused Conv-ReLU-Pool block, the fused loss and the
+whole Network with and without fusion or a memory plan), all in float64.
+It reports the max abs/rel error of every output and gradient, a central-
+difference gradient check of the fast backend, and its speedup.
+
+    python -m benchmarks.differential                    # 8 cases per op
+    python -m benchmarks.differential --cases 50 --seed 3 --ops conv pool
+    python -m benchmarks.differential --no-timing        # errors only
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from benchmarks.layers import measure
+from src import reference
+from src.conv_algos import CONV_ALGORITHMS
+from src.network import (
+    ConvLayer,
+    ConvReLUPoolLayer,
+    DTypePolicy,
+    FullyConnectedLayer,
+    MaxPoolLayer,
+    Network,
+    ReLULayer,
+    SoftmaxCrossEntropyLoss,
+    Workspace,
+    col2im,
+    im2col,
+)
+
+FLOAT64 = DTypePolicy(np.float64, np.float64, np.float64)
+
+
+def max_errors(ref, fast):
+    # Max abs error, and that relative to the largest reference magnitude
+    ref = np.asarray(ref, dtype=np.float64)
+    fast = np.asarray(fast, dtype=np.float64)
+    if ref.shape != fast.shape:
+        return np.inf, np.inf
+    if ref.size == 0:
+        return 0.0, 0.0
+    abs_err = float(np.max(np.abs(ref - fast)))
+    return abs_err, abs_err / max(float(np.max(np.abs(ref))), 1e-12)
+
+
+def relative_error(a, b):
+    return abs(a - b) / max(abs(a), abs(b), 1e-12)
+
+
+def gradient_check(loss_fn, params, analytic, rng, probes, eps=1e-7):
+    """
+    Largest error between analytic gradients and central differences of
+    loss_fn() at `probes` random entries of each array in params (which
+    are perturbed in place and restored), relative to the largest analytic
+    gradient of that array as in max_errors.
+    """
+    worst = 0.0
+    for array, grad in zip(params, analytic):
+        flat = array.reshape(-1)
+        scale = max(float(np.max(np.abs(grad))), 1e-12)
+        for i in rng.choice(flat.size, min(probes, flat.size), replace=False):
+            original = flat[i]
+            flat[i] = original + eps
+            plus = loss_fn()
+            flat[i] = original - eps
+            minus = loss_fn()
+            flat[i] = original
+            numeric = (plus - minus) / (2 * eps)
+            worst = max(worst, abs(numeric - grad.reshape(-1)[i]) / scale)
+    return worst
+
+
+def describe(params):
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+# --- Case generators: random parameters valid for every reference layer ---
+
+
+def sample_conv(rng):
+    k = int(rng.randint(1, 6))
+    p = int(rng.randint(0, 3))
+    low = max(k - 2 * p, 1)
+    return {
+        "N": int(rng.randint(1, 4)),
+        "C": int(rng.randint(1, 4)),
+        "H": int(rng.randint(low, 13)),
+        "W": int(rng.randint(low, 13)),
+        "K": int(rng.randint(1, 6)),
+        "k": k,
+        "s": int(rng.randint(1, 4)),
+        "p": p,
+    }
+
+
+def sample_fused(rng):
+    # Conv output at least one pooling window big, pooling non-overlapping
+    while True:
+        params = sample_conv(rng)
+        params["pool"] = int(rng.randint(2, 4))
+        H_out = (params["H"] + 2 * params["p"] - params["k"]) // params["s"] + 1
+        W_out = (params["W"] + 2 * params["p"] - params["k"]) // params["s"] + 1
+        if min(H_out, W_out) >= params["pool"]:
+            return params
+
+
+def sample_pool(rng):
+    pool = int(rng.randint(2, 4))
+    return {
+        "N": int(rng.randint(1, 4)),
+        "C": int(rng.randint(1, 4)),
+        "H": int(rng.randint(pool, 11)),
+        "W": int(rng.randint(pool, 11)),
+        "pool": pool,
+        "s": int(rng.randint(1, pool + 1)),
+    }
+
+
+def conv_weights(params, rng):
+    K, C, k = params["K"], params["C"], params["k"]
+    return rng.standard_normal((K, C, k, k)), rng.standard_normal(K)
+
+
+def fast_conv(params, W, b, algorithm):
+    conv = ConvLayer(
+        params["C"], params["K"], params["k"], params["s"], params["p"], algorithm
+    )
+    conv.set_policy(FLOAT64)
+    conv.W, conv.b = W.copy(), b.copy()
+    return conv
+
+
+class Chain:
+    # Reference layers run back to back; parameters live on the first
+    def __init__(self, *layers):
+        self.layers = layers
+        self.conv = layers[0]
+
+    def forward(self, X):
+        for layer in self.layers:
+            X = layer.forward(X)
+        return X
+
+    def backward(self, dOut):
+        for layer in reversed(self.layers):
+            dOut = layer.backward(dOut)
+        return dOut
+
+
+def run_layer(layer, X, dOut, owner=None):
+    # Forward + backward, copying results out of any reused buffers
+    owner = owner if owner is not None else layer
+    results = {"out": layer.forward(X).copy(), "dX": layer.backward(dOut).copy()}
+    if hasattr(owner, "W"):
+        results["dW"] = owner.dW.copy()
+        results["db"] = owner.db.copy()
+    return results
+
+
+class LayerCase:
+    """
+    One randomized case: a reference layer and fast backends computing the
+    same function of X (and W/b when the layer has parameters).
+    """
+
+    def __init__(self, params, X, dOut, reference_layer, backends):
+        self.params = params
+        self.X = X
+        self.dOut = dOut
+        self.reference_layer = reference_layer
+        # name -> (layer, parameter owner or None)
+        self.backends = backends
+
+    def reference(self):
+        return run_layer(self.reference_layer, self.X, self.dOut)
+
+    def fast(self, name):
+        layer, owner = self.backends[name]
+        return run_layer(layer, self.X, self.dOut, owner)
+
+    def gradient_check(self, name, results, rng, probes):
+        layer, owner = self.backends[name]
+        owner = owner if owner is not None else layer
+        X = self.X.copy()
+        arrays, grads = [X], [results["dX"]]
+        if hasattr(owner, "W"):
+            arrays += [owner.W, owner.b]
+            grads += [results["dW"], results["db"]]
+
+        def loss():
+            return float(np.sum(layer.forward(X) * self.dOut))
+
+        return gradient_check(loss, arrays, grads, rng, probes)
+
+
+def conv_case(rng):
+    params = sample_conv(rng)
+    X = rng.standard_normal((params["N"], params["C"], params["H"], params["W"]))
+    W, b = conv_weights(params, rng)
+    ref = reference.ConvLayer(W, b, params["s"], params["p"])
+    out_shape = ref.forward(X).shape
+    backends = {}
+    for name, algorithm in CONV_ALGORITHMS.items():
+        conv = fast_conv(params, W, b, name)
+        if algorithm.supports(conv, X.shape):
+            backends[name] = (conv, None)
+    return LayerCase(params, X, rng.standard_normal(out_shape), ref, backends)
+
+
+def fused_case(rng):
+    params = sample_fused(rng)
+    X = rng.standard_normal((params["N"], params["C"], params["H"], params["W"]))
+    W, b = conv_weights(params, rng)
+    pool = params["pool"]
+    ref = Chain(
+        reference.ConvLayer(W, b, params["s"], params["p"]),
+        reference.ReLULayer(),
+        reference.MaxPoolLayer(pool, pool),
+    )
+    out_shape = ref.forward(X).shape
+    backends = {}
+    for name, algorithm in CONV_ALGORITHMS.items():
+        conv = fast_conv(params, W, b, name)
+        if algorithm.supports(conv, X.shape):
+            relu, maxpool = ReLULayer(), MaxPoolLayer(pool, pool)
+            relu.set_policy(FLOAT64)
+            maxpool.set_policy(FLOAT64)
+            backends[name] = (ConvReLUPoolLayer(conv, relu, maxpool), conv)
+    return LayerCase(params, X, rng.standard_normal(out_shape), ref, backends)
+
+
+def pool_case(rng):
+    params = sample_pool(rng)
+    X = rng.standard_normal((params["N"], params["C"], params["H"], params["W"]))
+    ref = reference.MaxPoolLayer(params["pool"], params["s"])
+    out_shape = ref.forward(X).shape
+    fast = MaxPoolLayer(params["pool"], params["s"])
+    fast.set_policy(FLOAT64)
+    return LayerCase(
+        params, X, rng.standard_normal(out_shape), ref, {"vectorized": (fast, None)}
+    )
+
+
+def fc_case(rng):
+    params = {
+        "N": int(rng.randint(1, 5)),
+        "in": int(rng.randint(1, 41)),
+        "out": int(rng.randint(1, 13)),
+    }
+    X = rng.standard_normal((params["N"], params["in"]))
+    W = rng.standard_normal((params["in"], params["out"]))
+    b = rng.standard_normal(params["out"])
+    fast = FullyConnectedLayer(params["in"], params["out"])
+    fast.set_policy(FLOAT64)
+    fast.W, fast.b = W.copy(), b.copy()
+    return LayerCase(
+        params,
+        X,
+        rng.standard_normal((params["N"], params["out"])),
+        reference.FullyConnectedLayer(W, b),
+        {"gemm": (fast, None)},
+    )
+
+
+class Im2colCase:
+    """
+    im2col/col2im with and without a Workspace. The gradient column holds
+    the adjoint identity <im2col(X), Y> = <X, col2im(Y)>, since col2im is
+    exactly the backward of im2col.
+    """
+
+    def __init__(self, rng):
+        self.params = sample_conv(rng)
+        del self.params["K"]
+        p = self.params
+        self.X = rng.standard_normal((p["N"], p["C"], p["H"], p["W"]))
+        col = reference.im2col(self.X, p["k"], p["s"], p["p"])
+        self.Y = rng.standard_normal(col.shape)
+        self.backends = {"plain": None, "workspace": Workspace()}
+
+    def _run(self, im2col_fn, col2im_fn):
+        p = self.params
+        args = (p["k"], p["s"], p["p"])
+        return {
+            "col": im2col_fn(self.X, *args).copy(),
+            "col2im": col2im_fn(self.Y, self.X.shape, *args).copy(),
+        }
+
+    def reference(self):
+        return self._run(reference.im2col, reference.col2im)
+
+    def fast(self, name):
+        workspace = self.backends[name]
+        return self._run(
+            lambda *args: im2col(*args, workspace),
+            lambda *args: col2im(*args, workspace),
+        )
+
+    def gradient_check(self, name, results, rng, probes):
+        lhs = float(np.sum(results["col"] * self.Y))
+        rhs = float(np.sum(self.X * results["col2im"]))
+        return relative_error(lhs, rhs)
+
+
+class LossCase:
+    def __init__(self, rng):
+        self.params = {"N": int(rng.randint(1, 7)), "classes": int(rng.randint(2, 13))}
+        N, classes = self.params["N"], self.params["classes"]
+        self.logits = 3 * rng.standard_normal((N, classes))
+        self.y = rng.randint(0, classes, size=N)
+        self.backends = {"fused": SoftmaxCrossEntropyLoss()}
+
+    def reference(self):
+        loss, grad = reference.softmax_cross_entropy(self.logits, self.y)
+        return {"loss": loss, "dlogits": grad}
+
+    def fast(self, name):
+        loss, grad = self.backends[name].forward(self.logits, self.y)
+        return {"loss": loss, "dlogits": grad.copy()}
+
+    def gradient_check(self, name, results, rng, probes):
+        logits = self.logits.copy()
+        loss_layer = self.backends[name]
+
+        def loss():
+            return float(loss_layer.forward(logits, self.y)[0])
+
+        return gradient_check(loss, [logits], [results["dlogits"]], rng, probes)
+
+
+class NetworkCase:
+    """
+    The full training step: Network.loss_and_backward against the
+    reference layers carrying the same weights, unfused, fused (per conv
+    algorithm) and fused with a compiled memory plan.
+    """
+
+    def __init__(self, rng):
+        self.params = {"N": int(rng.randint(1, 5))}
+        N = self.params["N"]
+        self.X = rng.standard_normal((N, 1, 28, 28))
+        self.y = rng.randint(0, 10, size=N)
+        template = Network(policy=FLOAT64, fuse=False)
+        for layer, name in template.parameters():
+            value = getattr(layer, name)
+            setattr(layer, name, rng.standard_normal(value.shape) * 0.1)
+        self.reference_net = reference.ReferenceNetwork(template)
+
+        self.backends = {"unfused": self._copy(template, fuse=False)}
+        for algorithm in CONV_ALGORITHMS:
+            self.backends[f"fused/{algorithm}"] = self._copy(
+                template, conv_algorithm=algorithm
+            )
+        planned = self._copy(template)
+        planned.compile(self.X.shape)
+        self.backends["planned"] = planned
+
+    @staticmethod
+    def _copy(template, **kwargs):
+        net = Network(policy=FLOAT64, **kwargs)
+        for (layer, name), (source, _) in zip(net.parameters(), template.parameters()):
+            setattr(layer, name, getattr(source, name).copy())
+        return net
+
+    def reference(self):
+        loss = self.reference_net.loss_and_backward(self.X, self.y)
+        names = ("conv.dW", "conv.db", "fc.dW", "fc.db")
+        return dict(zip(names, self.reference_net.gradients()), loss=loss)
+
+    def fast(self, name):
+        net = self.backends[name]
+        loss = net.loss_and_backward(self.X, self.y)
+        grads = [getattr(layer, "d" + attr).copy() for layer, attr in net.parameters()]
+        names = ("conv.dW", "conv.db", "fc.dW", "fc.db")
+        return dict(zip(names, grads), loss=loss)
+
+    def gradient_check(self, name, results, rng, probes):
+        net = self.backends[name]
+        arrays = [getattr(layer, attr) for layer, attr in net.parameters()]
+        grads = [results[k] for k in ("conv.dW", "conv.db", "fc.dW", "fc.db")]
+
+        def loss():
+            return float(net.loss_and_backward(self.X, self.y))
+
+        return gradient_check(loss, arrays, grads, rng, probes)
+
+
+OPS = {
+    "im2col": Im2colCase,
+    "conv": conv_case,
+    "pool": pool_case,
+    "fused": fused_case,
+    "fc": fc_case,
+    "loss": LossCase,
+    "network": NetworkCase,
+}
+
+
+def speedup(case, name, warmup, repeats):
+    ref_time = measure(case.reference, warmup, repeats)["median_us"]
+    fast_time = measure(lambda: case.fast(name), warmup, repeats)["median_us"]
+    return ref_time / fast_time
+
+
+def run(ops, num_cases, seed, rtol, grad_rtol, probes, timing, repeats):
+    rng = np.random.RandomState(seed)
+    failures = []
+    print(
+        f"{'op':<8} {'backend':<16} {'max abs':>9} {'max rel':>9} "
+        f"{'grad rel':>9} {'speedup':>8}  case"
+    )
+    for op in ops:
+        for _ in range(num_cases):
+            case = OPS[op](rng)
+            expected = case.reference()
+            for name in case.backends:
+                results = case.fast(name)
+                errors = [max_errors(expected[k], results[k]) for k in expected]
+                abs_err = max(e[0] for e in errors)
+                rel_err = max(e[1] for e in errors)
+                grad_err = case.gradient_check(name, results, rng, probes)
+                ratio = speedup(case, name, 1, repeats) if timing else np.nan
+
+                ok = rel_err <= rtol and grad_err <= grad_rtol
+                if not ok:
+                    failures.append((op, name, case.params))
+                print(
+                    f"{op:<8} {name:<16} {abs_err:>9.1e} {rel_err:>9.1e} "
+                    f"{grad_err:>9.1e} {ratio:>7.1f}x  {describe(case.params)}"
+                    + ("" if ok else "  FAIL"),
+                    flush=True,
+                )
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference vs fast kernel checks")
+    parser.add_argument("--ops", nargs="+", choices=list(OPS), default=list(OPS))
+    parser.add_argument("--cases", type=int, default=8, help="random cases per op")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rtol", type=float, default=1e-7)
+    parser.add_argument("--grad-rtol", type=float, default=1e-5)
+    parser.add_argument("--probes", type=int, default=6, help="entries per array")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--no-timing", action="store_true")
+    args = parser.parse_args(argv)
+
+    failures = run(
+        args.ops,
+        args.cases,
+        args.seed,
+        args.rtol,
+        args.grad_rtol,
+        args.probes,
+        not args.no_timing,
+        args.repeats,
+    )
+    if failures:
+        print(f"\n{len(failures)} backend case(s) disagree with the reference:")
+        for op, name, params in failures:
+            print(f"  {op}/{name}: {describe(params)}")
+        return 1
+    print("\nAll backends match the reference")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Per-layer forward/backward timings with JSON baselines.
+
+    python -m benchmarks.layers                       # time and print
+    python -m benchmarks.layers --save-baseline       # record a baseline
+    python -m benchmarks.layers --threshold 0.15      # fail on >15% slowdowns
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from src.network import (
+    ConvLayer,
+    ConvReLUPoolLayer,
+    FlattenLayer,
+    FullyConnectedLayer,
+    MaxPoolLayer,
+    ReLULayer,
+    SoftmaxLayer,
+    Workspace,
+    col2im,
+    im2col,
+)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(HERE, "results.json")
+DEFAULT_BATCH_SIZES = (1, 16, 64, 256)
+
+
+def layer_case(layer, input_shape):
+    """
+    (forward, backward) callables for one layer at one input shape. The
+    forward runs once up front so backward has saved state to work from;
+    timing backward repeatedly reuses it, as every layer allows.
+    """
+    rng = np.random.RandomState(0)
+    X = rng.standard_normal(input_shape).astype(np.float32)
+    out = layer.forward(X)
+    dOut = rng.standard_normal(out.shape).astype(np.float32)
+    return (lambda: layer.forward(X)), (lambda: layer.backward(dOut))
+
+
+def im2col_case(N):
+    X = np.random.RandomState(0).standard_normal((N, 8, 14, 14)).astype(np.float32)
+    workspace = Workspace()
+    col = im2col(X, 3, 1, 1, workspace).copy()
+    return (
+        lambda: im2col(X, 3, 1, 1, workspace),
+        lambda: col2im(col, X.shape, 3, 1, 1, workspace),
+    )
+
+
+def build_cases(N):
+    # The shapes each layer sees inside Network
+    conv = ConvLayer(1, 8, kernel_size=3, stride=1, padding=1)
+    return {
+        "ConvLayer": layer_case(conv, (N, 1, 28, 28)),
+        "ReLULayer": layer_case(ReLULayer(), (N, 8, 28, 28)),
+        "MaxPoolLayer": layer_case(MaxPoolLayer(2, 2), (N, 8, 28, 28)),
+        "FlattenLayer": layer_case(FlattenLayer(), (N, 8, 14, 14)),
+        "FullyConnectedLayer": layer_case(FullyConnectedLayer(1568, 10), (N, 1568)),
+        "SoftmaxLayer": layer_case(SoftmaxLayer(), (N, 10)),
+        "ConvReLUPoolLayer": layer_case(
+            ConvReLUPoolLayer(
+                ConvLayer(1, 8, 3, 1, 1), ReLULayer(), MaxPoolLayer(2, 2)
+            ),
+            (N, 1, 28, 28),
+        ),
+        "im2col/col2im": im2col_case(N),
+    }
+
+
+def measure(fn, warmup, repeats, min_sample_time=1e-3):
+    """
+    Median and interquartile range of one call, in microseconds. Fast
+    calls are looped so each sample lasts at least min_sample_time.
+    """
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    fn()
+    once = time.perf_counter() - start
+    number = max(1, int(min_sample_time / max(once, 1e-9)))
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    q25, median, q75 = np.percentile(samples, [25, 50, 75]) * 1e6
+    return {
+        "median_us": float(median),
+        "iqr_us": float(q75 - q25),
+        "repeats": repeats,
+        "number": number,
+    }
+
+
+def run(batch_sizes, warmup, repeats, name_filter=None):
+    results = {}
+    for N in batch_sizes:
+        for name, (forward, backward) in build_cases(N).items():
+            if name_filter and name_filter not in name:
+                continue
+            for direction, fn in (("forward", forward), ("backward", backward)):
+                key = f"{name}/{direction}/N={N}"
+                results[key] = measure(fn, warmup, repeats)
+                r = results[key]
+                print(
+                    f"{key:<40} {r['median_us']:>11.1f} us  "
+                    f"(IQR {r['iqr_us']:.1f})",
+                    flush=True,
+                )
+    return results
+
+
+def compare(results, baseline, threshold):
+    # A case regresses when its median is more than `threshold` slower
+    regressions = []
+    print(f"\nAgainst baseline (fail above +{threshold * 100:.0f}%):")
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"  {key:<40} (new)")
+            continue
+        change = r["median_us"] / base["median_us"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"  {key:<40} {change * 100:>+7.1f}%{flag}")
+    return regressions
+
+
+def metadata():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save(path, results):
+    with open(path, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-layer benchmarks")
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=list(DEFAULT_BATCH_SIZES)
+    )
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=15)
+    parser.add_argument("--filter", help="only cases whose name contains this")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args.batch_sizes, args.warmup, args.repeats, args.filter)
+    save(args.output, results)
+    print(f"\nWrote {args.output}")
+
+    if args.save_baseline:
+        save(args.baseline, results)
+        print(f"Saved baseline {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
 from src.data import load_mnist_data
 from src.network import Network
 from src.train import train_network
+import argparse
 import numpy as np
 
 
-def main():
+def train(resume=False):
     # Load the MNIST data
     X_train, y_train, X_test, y_test = load_mnist_data()
 
@@ -28,7 +29,46 @@ def main():
         batch_size=64,
         learning_rate=0.01,
         print_every=1,
+        optimizer="momentum",
+        checkpoint_dir="checkpoints",
+        resume=resume,
+        eval_subsample=2000,
+    )
+
+
+def predict(args):
+    from src.checkpoint import Checkpointer
+    from src.predict import predict_stream
+
+    net = Network()
+    path = Checkpointer(args.checkpoint).load_parameters(net)
+    if path is None:
+        raise SystemExit(f"No checkpoint found in {args.checkpoint}; train first")
+    print(f"Loaded {path}")
+    predict_stream(net, args.input, args.output, args.chunk_size, args.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or run the MNIST CNN")
+    sub = parser.add_subparsers(dest="command")
+    t = sub.add_parser("train", help="train on data/ (the default)")
+    t.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the latest checkpoint in checkpoints/",
     )
+    p = sub.add_parser("predict", help="score an IDX3 file or a PNG directory")
+    p.add_argument("input", help="IDX3 image file or directory of PNGs")
+    p.add_argument("output", help="output .npy or .csv file")
+    p.add_argument("--checkpoint", default="checkpoints", help="checkpoint directory")
+    p.add_argument("--chunk-size", type=int, default=1024)
+    p.add_argument("--workers", type=int, default=None, help="decoding processes")
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        predict(args)
+    else:
+        train(resume=getattr(args, "resume", False))
 
 
 if __name__ == "__main__":
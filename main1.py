@@ -4,6 +4,7 @@ from src.layout import DiagramLayout
 from src.dynamic import DiagramDynamic
 from src.data import load_mnist_data
 from src.network import Network
+from src.optim import SGD
 import numpy as np
 
 
@@ -83,6 +84,7 @@ def main():
     }
 
     learning_rate = 0.01
+    optimizer = SGD(net, lr=learning_rate)
 
     def update_progress():
         progress_label.config(
@@ -107,11 +109,7 @@ def main():
         loss = net.loss_and_backward(X_batch, y_batch)
 
         # Update params
-        for layer in net.layers:
-            if hasattr(layer, "W"):
-                layer.W -= learning_rate * layer.dW
-            if hasattr(layer, "b"):
-                layer.b -= learning_rate * layer.db
+        optimizer.step()
 
         # Update progress
         update_progress()
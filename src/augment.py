@@ -0,0 +1,174 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.parallel import shard_bounds
+
+
+def gaussian_matrix(size, sigma):
+    # G @ field @ G.T smooths every (size, size) field with a Gaussian
+    offsets = np.arange(size)[:, None] - np.arange(size)[None, :]
+    G = np.exp(-(offsets**2) / (2.0 * sigma * sigma))
+    return (G / G.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def bilinear_resample(X, src_x, src_y):
+    """
+    out[n, c, i, j] = X[n, c] sampled at (src_y[n, i, j], src_x[n, i, j])
+    with bilinear interpolation, reading zeros outside the image. All
+    images are resampled at once through one padded, flattened gather per
+    corner.
+    """
+    n, C, H, W = X.shape
+    padded = np.zeros((n, C, H + 2, W + 2), dtype=X.dtype)
+    padded[:, :, 1:-1, 1:-1] = X
+    padded = padded.reshape(n, C, -1)
+
+    x0 = np.floor(src_x)
+    y0 = np.floor(src_y)
+    fx = (src_x - x0).reshape(n, 1, -1)
+    fy = (src_y - y0).reshape(n, 1, -1)
+    # Shifted by the padding and clipped into it, so anything outside reads 0
+    x0 = x0.astype(np.intp) + 1
+    y0 = y0.astype(np.intp) + 1
+    xs = (np.clip(x0, 0, W + 1), np.clip(x0 + 1, 0, W + 1))
+    ys = (np.clip(y0, 0, H + 1) * (W + 2), np.clip(y0 + 1, 0, H + 1) * (W + 2))
+
+    def corner(row, col):
+        index = (row + col).reshape(n, 1, -1)
+        return np.take_along_axis(padded, index, axis=2)
+
+    top = corner(ys[0], xs[0]) * (1 - fx) + corner(ys[0], xs[1]) * fx
+    bottom = corner(ys[1], xs[0]) * (1 - fx) + corner(ys[1], xs[1]) * fx
+    return (top * (1 - fy) + bottom * fy).reshape(n, C, H, W)
+
+
+class Augmenter:
+    """
+    Random shifts (up to max_shift pixels), rotations (up to max_rotation
+    degrees) and elastic distortion applied to whole (N, C, H, W) batches
+    as one vectorized resampling, then Gaussian pixel noise; the result is
+    clipped to [0, 1]. elastic_alpha=34, elastic_sigma=4 are the settings
+    of Simard et al. for MNIST; elastic distortion and noise are off by
+    default.
+
+    Called as transform(X_batch, y_batch, batch_index) by
+    src.sampler.BatchLoader, it augments the batch in place. Randomness
+    comes from (seed, epoch, batch_index), so set_epoch() makes every
+    epoch reproducible, including after resuming mid-epoch. Everything
+    random is drawn for the whole batch before the batch is split across
+    num_workers threads, so results do not depend on the worker count.
+
+    busy_time and images count the time spent augmenting, for comparing
+    its throughput with training's.
+    """
+
+    def __init__(
+        self,
+        max_shift=2.0,
+        max_rotation=10.0,
+        elastic_alpha=0.0,
+        elastic_sigma=4.0,
+        noise_std=0.0,
+        seed=0,
+        num_workers=1,
+        min_chunk_size=16,
+    ):
+        self.max_shift = max_shift
+        self.max_rotation = np.deg2rad(max_rotation)
+        self.elastic_alpha = elastic_alpha
+        self.elastic_sigma = elastic_sigma
+        self.noise_std = noise_std
+        self.seed = seed
+        self.epoch = 0
+        self.num_workers = num_workers
+        self.min_chunk_size = min_chunk_size
+        self.pool = ThreadPoolExecutor(num_workers) if num_workers > 1 else None
+        self.smoothing = {}
+        self.reset_stats()
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def reset_stats(self):
+        self.busy_time = 0.0
+        self.images = 0
+
+    def stats(self):
+        return {
+            "images": self.images,
+            "seconds": self.busy_time,
+            "images_per_s": self.images / self.busy_time if self.busy_time else 0.0,
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def sample_grid(self, rng, N, H, W):
+        # Source coordinates of every output pixel, shape (N, H, W) each
+        angles = rng.uniform(-self.max_rotation, self.max_rotation, N)
+        shifts = rng.uniform(-self.max_shift, self.max_shift, (2, N))
+        cos = np.cos(angles).astype(np.float32)[:, None, None]
+        sin = np.sin(angles).astype(np.float32)[:, None, None]
+        cy, cx = (H - 1) / 2.0, (W - 1) / 2.0
+        y = np.arange(H, dtype=np.float32)[None, :, None] - cy
+        x = np.arange(W, dtype=np.float32)[None, None, :] - cx
+        src_x = cos * x - sin * y + (cx + shifts[0].astype(np.float32))[:, None, None]
+        src_y = sin * x + cos * y + (cy + shifts[1].astype(np.float32))[:, None, None]
+
+        if self.elastic_alpha:
+            if (H, W) not in self.smoothing:
+                self.smoothing[H, W] = (
+                    gaussian_matrix(H, self.elastic_sigma),
+                    gaussian_matrix(W, self.elastic_sigma),
+                )
+            GH, GW = self.smoothing[H, W]
+            field = rng.uniform(-1.0, 1.0, (2, N, H, W)).astype(np.float32)
+            field = GH @ field @ GW.T
+            src_x += self.elastic_alpha * field[0]
+            src_y += self.elastic_alpha * field[1]
+        return src_x, src_y
+
+    def chunk_bounds(self, N):
+        num_chunks = max(1, min(self.num_workers, N // self.min_chunk_size))
+        return shard_bounds(N, num_chunks)
+
+    def apply(self, X, src_x, src_y, noise):
+        X[...] = bilinear_resample(X, src_x, src_y)
+        if noise is not None:
+            X += noise
+        np.clip(X, 0.0, 1.0, out=X)
+
+    def __call__(self, X, y=None, batch_index=0):
+        start = time.perf_counter()
+        N, C, H, W = X.shape
+        rng = np.random.default_rng([self.seed, self.epoch, batch_index])
+        src_x, src_y = self.sample_grid(rng, N, H, W)
+        noise = None
+        if self.noise_std:
+            noise = rng.standard_normal(X.shape, dtype=np.float32)
+            noise *= self.noise_std
+
+        bounds = self.chunk_bounds(N)
+        if self.pool is None or len(bounds) == 1:
+            self.apply(X, src_x, src_y, noise)
+        else:
+            futures = [
+                self.pool.submit(
+                    self.apply,
+                    X[lo:hi],
+                    src_x[lo:hi],
+                    src_y[lo:hi],
+                    None if noise is None else noise[lo:hi],
+                )
+                for lo, hi in bounds
+            ]
+            for future in futures:
+                future.result()
+
+        self.busy_time += time.perf_counter() - start
+        self.images += N
+        return X
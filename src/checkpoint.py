@@ -0,0 +1,274 @@
+import json
+import os
+import shutil
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.fileutil import atomic_write
+
+MANIFEST = "manifest.json"
+LATEST = "LATEST"
+FORMAT_VERSION = 1
+
+
+def resume_position(state, batch_size):
+    """
+    (epoch, batch) to continue from for a state returned by
+    Checkpointer.load. Batch positions are stored in units of the batch
+    size they were saved with, so they are converted to batch_size.
+    """
+    saved_batch_size = state["extra"].get("batch_size", batch_size)
+    return state["epoch"], state["batch"] * saved_batch_size // batch_size
+
+
+def parameter_layout(net):
+    # JSON-friendly description used to refuse checkpoints of another model
+    return [
+        [i, name, list(getattr(layer, name).shape)]
+        for i, (layer, name) in enumerate(net.parameters())
+    ]
+
+
+class Checkpointer:
+    """
+    Saves and restores training state as a directory of .npy files plus a
+    JSON manifest:
+
+        <directory>/ckpt-<step>-<ns>/params.npy      flat parameter vector
+                                    opt_<name>.npy  optimizer state vectors
+                                    order.npy       epoch sample order
+                                    rng_keys.npy    numpy global RNG keys
+                                    manifest.json   position, shapes, etc.
+        <directory>/LATEST                          name of the newest one
+
+    save() copies the vectors (a memcpy) and hands the file writes to a
+    background thread. Each checkpoint is written under a temporary name
+    and renamed into place before LATEST is switched to it, so a crash
+    mid-write leaves the previous checkpoint intact. load() memory-maps
+    the arrays and copies them into the live buffers.
+    """
+
+    def __init__(self, directory, keep=2):
+        self.directory = directory
+        self.keep = keep
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def latest(self):
+        try:
+            with open(os.path.join(self.directory, LATEST)) as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(os.path.join(path, MANIFEST)) else None
+
+    def save(self, optimizer, epoch, batch, order=None, extra=None, block=False):
+        """
+        Snapshot `optimizer` (its parameter buffer and state) at the given
+        position: `batch` is the next batch to run in `epoch`. Returns a
+        future; with block=True waits for the write to finish.
+        """
+        if self.pending is not None and self.pending.done():
+            self.pending.result()  # surface a failed background write here
+
+        buffer = optimizer.buffer
+        rng_name, rng_keys, rng_pos, has_gauss, cached_gauss = np.random.get_state()
+        arrays = {
+            "params": buffer.params.copy(),
+            "rng_keys": rng_keys.copy(),
+        }
+        for name, vector in optimizer.state_vectors().items():
+            arrays[f"opt_{name}"] = vector.copy()
+        if order is not None:
+            arrays["order"] = np.array(order, copy=True)
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "epoch": int(epoch),
+            "batch": int(batch),
+            "optimizer": type(optimizer).__name__,
+            "optimizer_config": optimizer.state_config(),
+            "step_count": int(optimizer.step_count),
+            "lr": float(optimizer.lr),
+            "parameters": parameter_layout(buffer.net),
+            "rng": [rng_name, int(rng_pos), int(has_gauss), float(cached_gauss)],
+            "arrays": sorted(arrays),
+            "extra": extra or {},
+        }
+        # The timestamp keeps a re-save at the same step from replacing a
+        # checkpoint that LATEST may still point to
+        name = f"ckpt-{optimizer.step_count:08d}-{time.time_ns()}"
+
+        # One writer thread, so checkpoints land in the order they were taken
+        self.pending = self.pool.submit(self._write, name, arrays, manifest)
+        if block:
+            self.pending.result()
+        return self.pending
+
+    def _write(self, name, arrays, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        final_path = os.path.join(self.directory, name)
+        tmp_path = os.path.join(self.directory, f".{name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        for key, arr in arrays.items():
+            with open(os.path.join(tmp_path, f"{key}.npy"), "wb") as f:
+                np.save(f, arr)
+                f.flush()
+                os.fsync(f.fileno())
+        with atomic_write(os.path.join(tmp_path, MANIFEST)) as f:
+            json.dump(manifest, f)
+
+        os.replace(tmp_path, final_path)
+        with atomic_write(os.path.join(self.directory, LATEST)) as f:
+            f.write(name)
+        self._prune(name)
+        return final_path
+
+    def _prune(self, newest):
+        names = sorted(
+            n
+            for n in os.listdir(self.directory)
+            if n.startswith("ckpt-") and n != newest
+        )
+        for old in names[: max(0, len(names) - (self.keep - 1))]:
+            shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+
+    def wait(self):
+        if self.pending is not None:
+            self.pending.result()
+
+    def load(self, optimizer, path=None):
+        """
+        Restore parameters, optimizer state and the global RNG from the
+        checkpoint at `path` (default: the latest). Returns a dict with
+        epoch, batch, order and extra, or None when there is nothing to
+        resume from. Raises ValueError if the checkpoint was written for a
+        different model or optimizer.
+        """
+        self.wait()
+        path = path or self.latest()
+        if path is None:
+            return None
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+
+        buffer = optimizer.buffer
+        if manifest["parameters"] != parameter_layout(buffer.net):
+            raise ValueError(f"Checkpoint {path} does not match the network layout")
+        if manifest["optimizer"] != type(optimizer).__name__:
+            raise ValueError(
+                f"Checkpoint {path} was written by {manifest['optimizer']}, "
+                f"not {type(optimizer).__name__}"
+            )
+
+        # Everything is checked before anything is copied, so a refused
+        # checkpoint leaves the live parameters untouched
+        config = manifest.get("optimizer_config")
+        if config is not None and config != optimizer.state_config():
+            raise ValueError(
+                f"Checkpoint {path} was written with optimizer settings "
+                f"{config}, not {optimizer.state_config()}"
+            )
+        vectors = optimizer.state_vectors()
+        saved = sorted(a[4:] for a in manifest["arrays"] if a.startswith("opt_"))
+        if saved != sorted(vectors):
+            raise ValueError(
+                f"Checkpoint {path} has optimizer state {saved}, "
+                f"not {sorted(vectors)}"
+            )
+
+        def mapped(key):
+            return np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r")
+
+        sources = {"params": mapped("params")}
+        sources.update((f"opt_{name}", mapped(f"opt_{name}")) for name in vectors)
+        targets = {"params": buffer.params}
+        targets.update((f"opt_{name}", v) for name, v in vectors.items())
+        for key, target in targets.items():
+            if sources[key].shape != target.shape:
+                raise ValueError(
+                    f"Checkpoint {path}: {key} has shape {sources[key].shape}, "
+                    f"expected {target.shape}"
+                )
+        for key, target in targets.items():
+            np.copyto(target, sources[key])
+        optimizer.step_count = manifest["step_count"]
+
+        rng_name, rng_pos, has_gauss, cached_gauss = manifest["rng"]
+        np.random.set_state(
+            (rng_name, np.array(mapped("rng_keys")), rng_pos, has_gauss, cached_gauss)
+        )
+        order = np.array(mapped("order")) if "order" in manifest["arrays"] else None
+        return {
+            "epoch": manifest["epoch"],
+            "batch": manifest["batch"],
+            "order": order,
+            "extra": manifest["extra"],
+            "path": path,
+        }
+
+    def load_parameters(self, net, path=None):
+        """
+        Copy only the trained parameters of a checkpoint into `net`, for
+        inference. Returns the checkpoint path, or None if there is none.
+        """
+        self.wait()
+        path = path or self.latest()
+        if path is None:
+            return None
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest["parameters"] != parameter_layout(net):
+            raise ValueError(f"Checkpoint {path} does not match the network layout")
+        params = np.load(os.path.join(path, "params.npy"), mmap_mode="r")
+
+        offset = 0
+        for layer, name in net.parameters():
+            param = getattr(layer, name)
+            param[...] = params[offset : offset + param.size].reshape(param.shape)
+            offset += param.size
+        return path
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TerminationFlag:
+    """
+    Turns SIGTERM into a flag the training loop polls between batches, so
+    it can checkpoint a consistent state before exiting. Only the main
+    thread can install signal handlers; elsewhere this is a plain flag.
+    """
+
+    def __init__(self, on_signal=None):
+        self.event = threading.Event()
+        self.on_signal = on_signal
+        self.previous = None
+        if threading.current_thread() is threading.main_thread():
+            self.previous = signal.signal(signal.SIGTERM, self._handle)
+
+    def _handle(self, signum, frame):
+        self.event.set()
+        if self.on_signal is not None:
+            self.on_signal()
+
+    def __bool__(self):
+        return self.event.is_set()
+
+    def restore(self):
+        if self.previous is not None:
+            signal.signal(signal.SIGTERM, self.previous)
+            self.previous = None
@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.fileutil import atomic_write
+from src.network import ConvLayer, pad_input
+
+DEFAULT_TUNING_FILE = os.path.join(
+    os.path.expanduser("~"), ".cache", "grey_cnn", "conv_tuning.json"
+)
+
+
+class ConvAlgorithm:
+    """
+    One way of computing a convolution without bias. forward() writes the
+    result as an (N * H_out * W_out, K) NHWC matrix into `out` and returns
+    the im2col matrix if it built one (so backward can reuse it), else None.
+    """
+
+    name = None
+
+    def supports(self, layer, input_shape):
+        return True
+
+    def forward(self, layer, X, W, workspace, out):
+        raise NotImplementedError
+
+
+class Im2colGemm(ConvAlgorithm):
+    name = "im2col"
+
+    def forward(self, layer, X, W, workspace, out):
+        # The layer's built-in path, also what algorithm="im2col" runs
+        return layer._im2col_gemm(X, W, workspace, out)
+
+
+class DirectTensordot(ConvAlgorithm):
+    # Accumulates one tensordot per kernel offset over shifted input views
+    name = "direct"
+
+    def forward(self, layer, X, W, workspace, out):
+        N = X.shape[0]
+        K, C, KH, KW = W.shape
+        H_out, W_out = layer.output_size(X.shape[2], X.shape[3])
+        X_padded = pad_input(X, layer.padding, workspace, key="direct_pad")
+        s = layer.stride
+
+        out4 = out.reshape(N, H_out, W_out, K)
+        out4.fill(0)
+        for y in range(KH):
+            for x in range(KW):
+                shifted = X_padded[:, :, y : y + s * H_out : s, x : x + s * W_out : s]
+                out4 += np.tensordot(shifted, W[:, :, y, x], axes=([1], [1]))
+        return None
+
+
+class FFTConv(ConvAlgorithm):
+    # Cross-correlation as a pointwise product of real FFTs (stride 1 only)
+    name = "fft"
+
+    def supports(self, layer, input_shape):
+        return layer.stride == 1
+
+    def forward(self, layer, X, W, workspace, out):
+        N = X.shape[0]
+        K = W.shape[0]
+        H_out, W_out = layer.output_size(X.shape[2], X.shape[3])
+        X_padded = pad_input(X, layer.padding, workspace, key="fft_pad")
+        Hp, Wp = X_padded.shape[2:]
+
+        X_f = np.fft.rfft2(X_padded, s=(Hp, Wp))
+        W_f = np.fft.rfft2(W, s=(Hp, Wp))
+        Y_f = np.einsum("nchw,kchw->nkhw", X_f, np.conj(W_f))
+        Y = np.fft.irfft2(Y_f, s=(Hp, Wp))[:, :, :H_out, :W_out]
+        np.copyto(out.reshape(N, H_out, W_out, K), Y.transpose(0, 2, 3, 1))
+        return None
+
+
+class WinogradF2x2_3x3(ConvAlgorithm):
+    # F(2x2, 3x3): 16 multiplies per 2x2 output tile instead of 36
+    name = "winograd"
+
+    B_T = np.array(
+        [[1, 0, -1, 0], [0, 1, 1, 0], [0, -1, 1, 0], [0, 1, 0, -1]], dtype=np.float64
+    )
+    G = np.array(
+        [[1, 0, 0], [0.5, 0.5, 0.5], [0.5, -0.5, 0.5], [0, 0, 1]], dtype=np.float64
+    )
+    A_T = np.array([[1, 1, 1, 0], [0, 1, -1, -1]], dtype=np.float64)
+
+    def supports(self, layer, input_shape):
+        return layer.kernel_size == 3 and layer.stride == 1
+
+    def forward(self, layer, X, W, workspace, out):
+        N, C, H, W_in = X.shape
+        K = W.shape[0]
+        dtype = out.dtype
+        H_out, W_out = layer.output_size(H, W_in)
+        tiles_h, tiles_w = -(-H_out // 2), -(-W_out // 2)
+
+        # Pad so the 4x4 input tiles (stride 2) cover every output pixel
+        p = layer.padding
+        X_padded = workspace.get(
+            ("winograd_pad", p), (N, C, 2 * tiles_h + 2, 2 * tiles_w + 2), X.dtype, True
+        )
+        X_padded[:, :, p : p + H, p : p + W_in] = X
+        sN, sC, sH, sW = X_padded.strides
+        tiles = np.lib.stride_tricks.as_strided(
+            X_padded,
+            shape=(N, C, tiles_h, tiles_w, 4, 4),
+            strides=(sN, sC, 2 * sH, 2 * sW, sH, sW),
+            writeable=False,
+        )
+
+        B_T, G, A_T = (m.astype(dtype) for m in (self.B_T, self.G, self.A_T))
+        U = np.einsum("ij,kcjl,ml->imkc", G, W, G, optimize=True)  # (4, 4, K, C)
+        V = np.einsum(
+            "ij,nctujl,ml->imcntu", B_T, tiles, B_T, optimize=True
+        )  # (4, 4, C, ...)
+        M = np.matmul(U.reshape(16, K, C), V.reshape(16, C, -1))
+        M = M.reshape(4, 4, K, N, tiles_h, tiles_w)
+        Y = np.einsum("ij,jlknab,ml->naibmk", A_T, M, A_T, optimize=True)
+        Y = Y.reshape(N, 2 * tiles_h, 2 * tiles_w, K)[:, :H_out, :W_out]
+        np.copyto(out.reshape(N, H_out, W_out, K), Y)
+        return None
+
+
+CONV_ALGORITHMS = {}
+
+
+def register_conv_algorithm(algorithm):
+    CONV_ALGORITHMS[algorithm.name] = algorithm
+    return algorithm
+
+
+for _algorithm in (Im2colGemm(), DirectTensordot(), FFTConv(), WinogradF2x2_3x3()):
+    register_conv_algorithm(_algorithm)
+
+
+class ConvAutotuner:
+    """
+    Picks the fastest registered algorithm per convolution signature by
+    timing each candidate on the real input, and remembers the choice in
+    a JSON tuning file so later runs skip the benchmark. "train" signatures
+    time forward + backward, "infer" signatures the forward pass only.
+    """
+
+    def __init__(self, path=None, warmup=1, repeats=5):
+        if path is None:
+            path = os.environ.get("GREY_CNN_CONV_TUNING", DEFAULT_TUNING_FILE)
+        self.path = path
+        self.warmup = warmup
+        self.repeats = repeats
+        self.lock = threading.Lock()
+        self.table = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        # Write then rename so a crash never leaves a half-written file
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with atomic_write(self.path) as f:
+                json.dump(self.table, f, indent=1, sort_keys=True)
+        except OSError:
+            pass
+
+    @staticmethod
+    def signature(layer, input_shape, dtype, mode):
+        N, C, H, W = input_shape
+        return (
+            f"{mode}|N={N},C={C},H={H},W={W},K={layer.out_channels},"
+            f"k={layer.kernel_size},stride={layer.stride},padding={layer.padding}"
+            f"|{np.dtype(dtype).name}"
+        )
+
+    def select(self, layer, X, mode):
+        key = self.signature(layer, X.shape, X.dtype, mode)
+        with self.lock:
+            entry = self.table.get(key)
+            if entry is not None and entry["algorithm"] in CONV_ALGORITHMS:
+                return CONV_ALGORITHMS[entry["algorithm"]]
+
+            timings = {}
+            for name, algorithm in CONV_ALGORITHMS.items():
+                if algorithm.supports(layer, X.shape):
+                    timings[name] = self._benchmark(layer, X, name, mode)
+            best = min(timings, key=timings.get)
+            self.table[key] = {"algorithm": best, "timings": timings}
+            self._save()
+            return CONV_ALGORITHMS[best]
+
+    def _benchmark(self, layer, X, name, mode):
+        # A throwaway layer sharing the weights, so the real one keeps its state
+        probe = ConvLayer(
+            X.shape[1],
+            layer.out_channels,
+            layer.kernel_size,
+            layer.stride,
+            layer.padding,
+            algorithm=name,
+        )
+        probe.set_policy(layer.policy)
+        probe.W, probe.b = layer.W, layer.b
+
+        def run():
+            if mode == "infer":
+                probe.infer(X)
+            else:
+                out = probe.forward(X)
+                probe.backward(out)
+
+        for _ in range(self.warmup):
+            run()
+        times = []
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return float(np.median(times))
+
+
+_default_autotuner = None
+
+
+def default_autotuner():
+    global _default_autotuner
+    if _default_autotuner is None:
+        _default_autotuner = ConvAutotuner()
+    return _default_autotuner
+
+
+def select_algorithm(layer, X, mode):
+    if layer.algorithm != "auto":
+        return CONV_ALGORITHMS[layer.algorithm]
+    return default_autotuner().select(layer, X, mode)
@@ -1,44 +1,405 @@
+import gzip
+import hashlib
+import json
 import os
+import shutil
 import struct
+import threading
+import warnings
+
 import numpy as np
 
+from src.fileutil import atomic_write
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "grey_cnn", "datasets"
+)
+CACHE_VERSION = 1
+# Everything load_mnist_data does to the raw pixels; part of every cache key
+PREPROCESSING = {"dtype": "float32", "scale": "1/255", "layout": "NCHW"}
+
+
+# Decompressed bytes per gzip read; the only transient buffer while loading
+GZIP_CHUNK = 1 << 20
+
+
+def is_gzip(path):
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def open_idx(path):
+    # Plain or gzipped IDX file, detected by its magic bytes
+    return gzip.open(path, "rb") if is_gzip(path) else open(path, "rb")
+
+
+def read_image_header(f):
+    header = f.read(16)
+    if len(header) != 16:
+        raise ValueError("Truncated images file header!")
+    magic, num_images, rows, cols = struct.unpack(">IIII", header)
+    if magic != 2051:
+        raise ValueError("Invalid magic number for images file!")
+    return num_images, rows, cols
+
+
+def read_label_header(f):
+    header = f.read(8)
+    if len(header) != 8:
+        raise ValueError("Truncated labels file header!")
+    magic, num_labels = struct.unpack(">II", header)
+    if magic != 2049:
+        raise ValueError("Invalid magic number for labels file!")
+    return num_labels
+
+
+def read_payload(f, shape, filename):
+    """
+    The rest of an IDX stream read into one preallocated uint8 array, a
+    chunk at a time, after checking its length against the header.
+    """
+    data = np.empty(shape, dtype=np.uint8)
+    view = memoryview(data.reshape(-1))
+    filled = 0
+    while filled < data.size:
+        n = f.readinto(view[filled : filled + GZIP_CHUNK])
+        if not n:
+            raise ValueError(
+                f"{filename}: header declares {data.size} data bytes, found {filled}"
+            )
+        filled += n
+    if f.read(1):
+        raise ValueError(f"{filename}: data continues past the {data.size} bytes")
+    return data
+
+
+def sidecar_path(path):
+    # Where the decompressed copy of a .gz IDX file is kept
+    return path[:-3] if path.endswith(".gz") else path + ".raw"
+
+
+def write_sidecar(path, header, data):
+    with atomic_write(sidecar_path(path), "wb") as f:
+        f.write(header)
+        data.tofile(f)
+
+
+def uncompressed(path, sidecar=False):
+    """
+    A plain IDX path for `path`: itself unless gzipped, else its sidecar
+    if newer than the .gz (written first when sidecar=True), else None.
+    Sidecars are opt-in, since the .gz may sit in a read-only or shared
+    directory.
+    """
+    if not is_gzip(path):
+        return path
+    target = sidecar_path(path)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+    if not sidecar:
+        return None
+    with open_idx(path) as f:
+        magic = f.read(4)
+    if magic == struct.pack(">I", 2051):
+        load_images(path, sidecar=True)
+    else:
+        load_labels(path, sidecar=True)
+    return target
+
+
+def load_images(filename, sidecar=False):
+    """
+    (N, rows, cols) uint8 images from an IDX3 file, plain or gzipped.
+    sidecar=True also writes a gzipped file's decompressed copy next to
+    it (see sidecar_path), which later loads read instead.
+    """
+    source = uncompressed(filename, sidecar=False) or filename
+    with open_idx(source) as f:
+        num_images, rows, cols = read_image_header(f)
+        data = read_payload(f, (num_images, rows, cols), source)
+    if sidecar and source == filename and is_gzip(filename):
+        header = struct.pack(">IIII", 2051, num_images, rows, cols)
+        write_sidecar(filename, header, data)
+    return data
+
+
+def load_labels(filename, sidecar=False):
+    source = uncompressed(filename, sidecar=False) or filename
+    with open_idx(source) as f:
+        num_labels = read_label_header(f)
+        labels = read_payload(f, (num_labels,), source)
+    if sidecar and source == filename and is_gzip(filename):
+        write_sidecar(filename, struct.pack(">II", 2049, num_labels), labels)
+    return labels
+
+
+def normalize_into(pixels, out):
+    # uint8 -> float32 in [0, 1] without temporaries; dividing in float32
+    # matches astype(np.float32) / 255.0 bit for bit
+    np.copyto(out, pixels, casting="unsafe")
+    np.divide(out, np.float32(255), out=out)
+    return out
+
+
+class IdxDataset:
+    """
+    Images memory-mapped as uint8 straight from an IDX3 file's payload,
+    with labels read from the matching IDX1 file. Opening costs only the
+    header reads; pages are faulted in as batches touch them and can be
+    evicted again, so resident memory stays small however large the file.
+
+    Indexing returns zero-copy uint8 views; batch() converts one batch
+    to normalized float32, into a reusable `out` buffer when given.
+
+    A gzipped images file is decompressed into memory, or with
+    sidecar=True mapped through its decompressed sidecar, written next to
+    it on first use.
+    """
+
+    def __init__(self, images_path, labels_path=None, sidecar=False):
+        path = uncompressed(images_path, sidecar)
+        if path is None:
+            self.images = load_images(images_path)[:, None]
+        else:
+            with open(path, "rb") as f:
+                count, rows, cols = read_image_header(f)
+            if os.path.getsize(path) != 16 + count * rows * cols:
+                raise ValueError(
+                    f"{path}: header declares {count} images of {rows}x{cols}, "
+                    f"file has {os.path.getsize(path) - 16} data bytes"
+                )
+            self.images = np.memmap(
+                path, dtype=np.uint8, mode="r", offset=16, shape=(count, 1, rows, cols)
+            )
+        count = len(self.images)
+        self.labels = None if labels_path is None else load_labels(labels_path)
+        if self.labels is not None and len(self.labels) != count:
+            raise ValueError(
+                f"{labels_path} has {len(self.labels)} labels for {count} images"
+            )
+        self.shape = self.images.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return self.images[index]
+
+    def batch(self, index, out=None):
+        """
+        Normalized float32 images for a slice or an index array (gathered
+        as uint8 first, a quarter of the float32 size).
+        """
+        pixels = self.images[index]
+        if out is None:
+            out = np.empty(pixels.shape, dtype=np.float32)
+        return normalize_into(pixels, out[: len(pixels)])
+
+    def load(self):
+        # The whole set as one float32 array, converted once
+        return self.batch(slice(None))
+
+
+def find_idx(data_dir, name):
+    # name as used here ("train-images.idx3-ubyte") or as officially
+    # distributed ("train-images-idx3-ubyte"), either one possibly gzipped;
+    # a .gz wins over a plain file, which may be its (stale) sidecar
+    for candidate in (name, name.replace(".idx", "-idx")):
+        for suffix in (".gz", ""):
+            path = os.path.join(data_dir, candidate + suffix)
+            if os.path.exists(path):
+                return path
+    return os.path.join(data_dir, name)
+
+
+def mnist_paths(data_dir="data"):
+    # ((train images, train labels), (test images, test labels))
+    return tuple(
+        (
+            find_idx(data_dir, f"{prefix}-images.idx3-ubyte"),
+            find_idx(data_dir, f"{prefix}-labels.idx1-ubyte"),
+        )
+        for prefix in ("train", "t10k")
+    )
+
+
+def open_mnist(data_dir="data", sidecar=False):
+    # (train, test) IdxDatasets over the raw files, nothing read up front
+    train, test = mnist_paths(data_dir)
+    return IdxDataset(*train, sidecar=sidecar), IdxDataset(*test, sidecar=sidecar)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """
+    Decoded, normalized datasets stored as .npy files in a directory named
+    by a hash of the source files' contents and PREPROCESSING, and memory-
+    mapped on later loads. Editing a source changes the key, so stale
+    entries are never read. An entry whose files disagree with its
+    manifest is deleted and rebuilt: sizes, shapes and dtypes are checked
+    on every load, and the full content checksums as well with verify=True.
+
+    Source checksums are remembered by (path, size, mtime) in sources.json,
+    so an unchanged file is hashed only once.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get("GREY_CNN_DATA_CACHE", DEFAULT_CACHE_DIR)
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def _index_path(self):
+        return os.path.join(self.directory, "sources.json")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        with atomic_write(self._index_path()) as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+
+    @staticmethod
+    def _source_checksum(path, index):
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = index.get(os.path.abspath(path))
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["sha256"]
+        checksum = file_checksum(path)
+        index[os.path.abspath(path)] = {"stamp": stamp, "sha256": checksum}
+        return checksum
 
-def load_images(filename):
-    with open(filename, "rb") as f:
-        magic, num_images, rows, cols = struct.unpack(">IIII", f.read(16))
-        if magic != 2051:
-            raise ValueError("Invalid magic number for images file!")
-        data = np.fromfile(f, dtype=np.uint8)
-        data = data.reshape(num_images, rows, cols)
-        return data
+    def key(self, images_path, labels_path, index):
+        spec = {
+            "version": CACHE_VERSION,
+            "images": self._source_checksum(images_path, index),
+            "labels": self._source_checksum(labels_path, index),
+            "preprocessing": PREPROCESSING,
+        }
+        encoded = json.dumps(spec, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()[:24]
 
+    def load(self, images_path, labels_path, verify=False):
+        """
+        (images, labels) of an IDX3/IDX1 pair as read-only memory maps,
+        building the cache entry first if it is missing or damaged.
+        """
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            index = self._load_index()
+            before = json.dumps(index, sort_keys=True)
+            key = self.key(images_path, labels_path, index)
+            if json.dumps(index, sort_keys=True) != before:
+                self._save_index(index)
 
-def load_labels(filename):
-    with open(filename, "rb") as f:
-        magic, num_labels = struct.unpack(">II", f.read(8))
-        if magic != 2049:
-            raise ValueError("Invalid magic number for labels file!")
-        labels = np.fromfile(f, dtype=np.uint8)
-        return labels
+            path = os.path.join(self.directory, key)
+            arrays = self._open(path, verify)
+            if arrays is None:
+                if os.path.exists(path):
+                    warnings.warn(f"Rebuilding corrupt dataset cache entry {path}")
+                    shutil.rmtree(path, ignore_errors=True)
+                self._build(path, images_path, labels_path)
+                arrays = self._open(path, verify=False)
+            return arrays
 
+    @staticmethod
+    def _open(path, verify):
+        try:
+            with open(os.path.join(path, "manifest.json")) as f:
+                manifest = json.load(f)
+            if manifest["version"] != CACHE_VERSION:
+                return None
+            arrays = []
+            for name in ("images", "labels"):
+                spec = manifest[name]
+                file_path = os.path.join(path, f"{name}.npy")
+                if os.path.getsize(file_path) != spec["bytes"]:
+                    return None
+                array = np.load(file_path, mmap_mode="r")
+                if list(array.shape) != spec["shape"] or array.dtype != spec["dtype"]:
+                    return None
+                if verify and file_checksum(file_path) != spec["sha256"]:
+                    return None
+                arrays.append(array)
+            return tuple(arrays)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
 
-def load_mnist_data(data_dir="data"):
-    train_images_path = os.path.join(data_dir, "train-images.idx3-ubyte")
-    train_labels_path = os.path.join(data_dir, "train-labels.idx1-ubyte")
-    test_images_path = os.path.join(data_dir, "t10k-images.idx3-ubyte")
-    test_labels_path = os.path.join(data_dir, "t10k-labels.idx1-ubyte")
+    @staticmethod
+    def _build(path, images_path, labels_path, chunk=4096):
+        # Written to a private directory and renamed into place, so readers
+        # never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_path)
+        try:
+            dataset = IdxDataset(images_path, labels_path)
+            images_file = os.path.join(tmp_path, "images.npy")
+            images = np.lib.format.open_memmap(
+                images_file, mode="w+", dtype=np.float32, shape=dataset.shape
+            )
+            for start in range(0, len(dataset), chunk):
+                dataset.batch(slice(start, start + chunk), images[start:])
+            images.flush()
+            del images
+            labels_file = os.path.join(tmp_path, "labels.npy")
+            np.save(labels_file, dataset.labels)
 
-    X_train = load_images(train_images_path)
-    y_train = load_labels(train_labels_path)
-    X_test = load_images(test_images_path)
-    y_test = load_labels(test_labels_path)
+            manifest = {"version": CACHE_VERSION, "preprocessing": PREPROCESSING}
+            for name, file_path, shape, dtype in (
+                ("images", images_file, dataset.shape, np.float32),
+                ("labels", labels_file, dataset.labels.shape, dataset.labels.dtype),
+            ):
+                manifest[name] = {
+                    "shape": list(shape),
+                    "dtype": np.dtype(dtype).str,
+                    "bytes": os.path.getsize(file_path),
+                    "sha256": file_checksum(file_path),
+                }
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=1)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another process finished the same entry first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
 
-    # Normalize the image data to [0, 1]
-    X_train = X_train.astype(np.float32) / 255.0
-    X_test = X_test.astype(np.float32) / 255.0
 
-    # For a CNN, reshape to (N, 1, 28, 28)
-    X_train = X_train.reshape(-1, 1, 28, 28)
-    X_test = X_test.reshape(-1, 1, 28, 28)
+def load_mnist_data(data_dir="data", cache=True, verify=False):
+    """
+    X_train, y_train, X_test, y_test with images normalized to [0, 1] and
+    shaped (N, 1, 28, 28). With cache (True or a DatasetCache) they are
+    read-only memory maps of the dataset cache, built on the first run;
+    cache=False converts the IDX files in memory every time.
+    """
+    if cache:
+        if not isinstance(cache, DatasetCache):
+            cache = DatasetCache()
+        train, test = mnist_paths(data_dir)
+        try:
+            X_train, y_train = cache.load(*train, verify=verify)
+            X_test, y_test = cache.load(*test, verify=verify)
+            return X_train, y_train, X_test, y_test
+        except OSError as e:
+            if not all(os.path.exists(p) for p in train + test):
+                raise
+            warnings.warn(f"Dataset cache unavailable ({e}); loading uncached")
 
-    return X_train, y_train, X_test, y_test
+    # One float32 conversion straight from the memory-mapped pixels, instead
+    # of reading the whole file and then astype plus a divide copy
+    train, test = open_mnist(data_dir)
+    return train.load(), train.labels, test.load(), test.labels
@@ -0,0 +1,353 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.network import Network
+from src.optim import bind_parameters, flatten_parameters
+from src.parallel import shard_bounds
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # optional: workers then use whatever BLAS threads they get
+    threadpool_limits = None
+
+
+class SharedArray:
+    """
+    A numpy array backed by a named shared-memory block. The spec
+    (name, shape, dtype) is all a worker needs to attach to it, so the
+    data itself is never pickled.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        shape = tuple(int(d) for d in shape)
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=nbytes)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, arr):
+        shared = cls(arr.shape, arr.dtype)
+        np.copyto(shared.array, arr)
+        return shared
+
+    @property
+    def spec(self):
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker(rank, config):
+    if threadpool_limits is not None:
+        threadpool_limits(limits=config["blas_threads"], user_api="blas")
+
+    shared = {key: SharedArray.attach(spec) for key, spec in config["arrays"].items()}
+    X, y = shared["X"].array, shared["y"].array
+    params, grads = shared["params"].array, shared["grads"].array
+    losses, progress = shared["losses"].array, shared["progress"].array
+    barrier = config["barrier"]
+    world = config["num_workers"]
+    batch_size = config["batch_size"]
+    lr = config["learning_rate"]
+    epoch_done, epoch_go = config["epoch_done"], config["epoch_go"]
+
+    net = Network(**config["network_kwargs"])
+    bind_parameters(net, params, grads[rank])
+    my_params = slice(*shard_bounds(params.size, world)[rank])
+
+    try:
+        step = 0
+        for epoch in range(config["epochs"]):
+            # Every worker draws the same permutation, so no index exchange
+            perm = np.random.RandomState(config["seed"] + epoch).permutation(len(X))
+
+            for b in range(config["num_batches"]):
+                batch = perm[b * batch_size : (b + 1) * batch_size]
+                if config["mode"] == "hogwild":
+                    # Disjoint slice of the global batch, applied without locks
+                    local = batch[rank::world]
+                    loss = net.loss_and_backward(X[local], y[local])
+                    params -= lr * grads[rank]
+                    losses[step, rank] = loss
+                    progress[rank] += len(local)
+                    step += 1
+                    continue
+
+                lo, hi = shard_bounds(len(batch), world)[rank]
+                local = batch[lo:hi]
+                weight = len(local) / len(batch)
+                loss = net.loss_and_backward(X[local], y[local])
+                grads[rank] *= weight
+                losses[step, rank] = loss * weight
+                progress[rank] += len(local)
+
+                # Reduce-scatter: each worker sums and applies its own chunk,
+                # in rank order, so the result does not depend on timing
+                barrier.wait()
+                params[my_params] -= lr * grads[:, my_params].sum(axis=0)
+                barrier.wait()
+                step += 1
+
+            # Hand the parameters to the parent between epochs and wait
+            # until it has read them (e.g. to evaluate) before going on
+            epoch_done.release()
+            if epoch + 1 < config["epochs"]:
+                epoch_go.acquire()
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        for arr in shared.values():
+            arr.close()
+
+
+class DataParallelTrainer:
+    """
+    Data-parallel SGD across worker processes. The training set, the flat
+    parameter vector and one gradient row per worker live in shared
+    memory, so nothing is pickled per step.
+
+    mode="sync": each global batch is split across workers; after a
+    barrier every worker reduces and applies its own slice of the
+    parameter vector (a reduce-scatter), then a second barrier publishes
+    the update. Matches single-process SGD up to float summation order.
+
+    mode="hogwild": workers apply their own gradients to the shared
+    parameters with no synchronisation at all (Recht et al., 2011).
+
+    One train() call copies the data into shared memory and starts the
+    workers once, however many epochs it runs; they pause between epochs
+    while the parent reads the parameters.
+    """
+
+    def __init__(
+        self,
+        net,
+        X_train,
+        y_train,
+        num_workers=2,
+        mode="sync",
+        batch_size=64,
+        learning_rate=0.01,
+        seed=0,
+        blas_threads=1,
+    ):
+        if mode not in ("sync", "hogwild"):
+            raise ValueError(f"Unknown mode {mode!r}; expected 'sync' or 'hogwild'")
+        self.net = net
+        self.X_train = X_train
+        self.y_train = y_train
+        self.num_workers = num_workers
+        self.mode = mode
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.seed = seed
+        self.blas_threads = blas_threads
+
+    def _copy_parameters(self, params):
+        # The shared parameter vector into the caller's arrays
+        offset = 0
+        for layer, name in self.net.parameters():
+            param = getattr(layer, name)
+            param[...] = params[offset : offset + param.size].reshape(param.shape)
+            offset += param.size
+
+    @staticmethod
+    def _wait_for_epoch(workers, epoch_done):
+        # One release per worker; a dead worker fails the run instead of
+        # leaving the parent waiting
+        for _ in workers:
+            while not epoch_done.acquire(timeout=0.1):
+                failed = [w.exitcode for w in workers if w.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(
+                        f"{len(failed)} worker(s) failed: exit codes {failed}"
+                    )
+
+    def train(self, epochs=1, max_batches=None, context=None, on_epoch=None):
+        """
+        Run `epochs` epochs and return stats for the whole run. After each
+        epoch the caller's network holds the current parameters and
+        on_epoch(epoch, stats), if given, is called with that epoch's
+        stats while the workers wait; epochs are numbered from 1.
+        """
+        ctx = context or mp.get_context()
+        num_batches = self.X_train.shape[0] // self.batch_size
+        if max_batches is not None:
+            num_batches = min(num_batches, max_batches)
+
+        compute_dtype = self.net.policy.compute_dtype
+        flat = flatten_parameters(self.net)
+        shared = {
+            "X": SharedArray.from_array(
+                np.ascontiguousarray(self.X_train, dtype=compute_dtype)
+            ),
+            "y": SharedArray.from_array(np.ascontiguousarray(self.y_train)),
+            "params": SharedArray.from_array(flat),
+            "grads": SharedArray(
+                (self.num_workers, flat.size), self.net.policy.accum_dtype
+            ),
+            "losses": SharedArray((epochs * num_batches, self.num_workers), np.float64),
+            "progress": SharedArray((self.num_workers,), np.int64),
+        }
+        shared["losses"].array.fill(0)
+        shared["progress"].array.fill(0)
+
+        config = {
+            "arrays": {key: arr.spec for key, arr in shared.items()},
+            "barrier": ctx.Barrier(self.num_workers),
+            "epoch_done": ctx.Semaphore(0),
+            "epoch_go": ctx.Semaphore(0),
+            "num_workers": self.num_workers,
+            "network_kwargs": {
+                "policy": self.net.policy,
+                "fuse": self.net.fuse,
+                "conv_algorithm": self.net.layers[0].algorithm,
+            },
+            "mode": self.mode,
+            "epochs": epochs,
+            "num_batches": num_batches,
+            "batch_size": self.batch_size,
+            "learning_rate": self.learning_rate,
+            "seed": self.seed,
+            "blas_threads": self.blas_threads,
+        }
+
+        def loss_history(rows):
+            losses = shared["losses"].array[rows]
+            return losses.sum(axis=1) if self.mode == "sync" else losses.mean(axis=1)
+
+        workers = [
+            ctx.Process(target=_worker, args=(rank, config), daemon=True)
+            for rank in range(self.num_workers)
+        ]
+        try:
+            # Timed without the between-epoch callbacks; the first epoch
+            # includes process start-up
+            elapsed, samples = 0.0, 0
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for epoch in range(1, epochs + 1):
+                self._wait_for_epoch(workers, config["epoch_done"])
+                seconds = time.perf_counter() - start
+                elapsed += seconds
+                total = int(shared["progress"].array.sum())
+                self._copy_parameters(shared["params"].array)
+                if on_epoch is not None:
+                    rows = slice((epoch - 1) * num_batches, epoch * num_batches)
+                    on_epoch(
+                        epoch,
+                        {
+                            "samples": total - samples,
+                            "seconds": seconds,
+                            "samples_per_sec": (total - samples) / seconds,
+                            "loss_history": loss_history(rows),
+                        },
+                    )
+                samples = total
+                start = time.perf_counter()
+                if epoch < epochs:
+                    for _ in workers:
+                        config["epoch_go"].release()
+            for worker in workers:
+                worker.join()
+            history = loss_history(slice(None))
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            for arr in shared.values():
+                arr.close()
+
+        return {
+            "num_workers": self.num_workers,
+            "mode": self.mode,
+            "samples": samples,
+            "seconds": elapsed,
+            "samples_per_sec": samples / elapsed,
+            "loss_history": history,
+        }
+
+
+def scaling_report(
+    X_train,
+    y_train,
+    worker_counts=(1, 2, 4),
+    mode="sync",
+    batch_size=64,
+    max_batches=50,
+    network_kwargs=None,
+):
+    """
+    Train a fresh network for max_batches steps at each worker count and
+    print samples/sec against the single-worker rate. Process start-up
+    is included in the timing, so use enough batches to amortise it.
+    """
+    results = []
+    for num_workers in worker_counts:
+        np.random.seed(0)
+        net = Network(**(network_kwargs or {}))
+        trainer = DataParallelTrainer(
+            net, X_train, y_train, num_workers, mode, batch_size=batch_size
+        )
+        results.append(trainer.train(epochs=1, max_batches=max_batches))
+
+    base = results[0]["samples_per_sec"]
+    print(f"Data-parallel scaling ({mode}, batch {batch_size}):")
+    print(f"  {'workers':>7} {'samples/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for r in results:
+        speedup = r["samples_per_sec"] / base
+        efficiency = speedup * results[0]["num_workers"] / r["num_workers"]
+        print(
+            f"  {r['num_workers']:>7} {r['samples_per_sec']:>10.1f} "
+            f"{speedup:>7.2f}x {efficiency * 100:>9.1f}%"
+        )
+    return results
+
+
+def train_data_parallel(
+    net,
+    X_train,
+    y_train,
+    X_test,
+    y_test,
+    epochs=5,
+    batch_size=64,
+    learning_rate=0.01,
+    num_workers=2,
+    mode="sync",
+):
+    from src.train import compute_accuracy
+
+    def report(epoch, stats):
+        avg_loss = float(np.mean(stats["loss_history"]))
+        print(
+            f"Epoch {epoch} completed. Average Loss: {avg_loss:.4f} "
+            f"({stats['samples_per_sec']:.0f} samples/s on {num_workers} "
+            f"{mode} workers)"
+        )
+        test_acc = compute_accuracy(X_test, y_test, net)
+        print(f"Test Accuracy after Epoch {epoch}: {test_acc * 100:.2f}%\n")
+
+    # Epoch e shuffles with seed + e - 1, so seed=1 gives epoch e seed e
+    trainer = DataParallelTrainer(
+        net, X_train, y_train, num_workers, mode, batch_size, learning_rate, seed=1
+    )
+    trainer.train(epochs, on_epoch=report)
+    print("Training completed.")
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+# Inference throughput peaks well below the full set: past a few hundred
+# images the im2col buffer falls out of cache
+DEFAULT_BATCH_SIZE = 256
+
+
+def count_correct(net, X, y, batch_size=DEFAULT_BATCH_SIZE):
+    # Inference-only forward in batches; nothing is kept for backward
+    correct = 0
+    for start in range(0, X.shape[0], batch_size):
+        out = net.predict(X[start : start + batch_size])
+        correct += int(
+            np.count_nonzero(out.argmax(axis=1) == y[start : start + batch_size])
+        )
+    return correct
+
+
+def stratified_subsample(y, size, seed=0):
+    """
+    Sorted indices of `size` samples with every class represented in
+    proportion to its share of y (largest-remainder rounding), drawn
+    with a fixed seed so repeated evaluations score the same subset.
+    """
+    rng = np.random.RandomState(seed)
+    size = min(size, len(y))
+    classes, counts = np.unique(y, return_counts=True)
+    quotas = counts * size / len(y)
+    take = np.floor(quotas).astype(int)
+    leftover = size - int(take.sum())
+    take[np.argsort(take - quotas, kind="stable")[:leftover]] += 1
+    picks = [
+        rng.choice(np.flatnonzero(y == c), k, replace=False)
+        for c, k in zip(classes, take)
+    ]
+    return np.sort(np.concatenate(picks))
+
+
+def wilson_interval(correct, n, z=1.96, population=None):
+    """
+    Wilson score interval for an accuracy of correct/n. When the n samples
+    are drawn without replacement from `population`, the finite population
+    correction narrows it (to a point once n == population).
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = correct / n
+    if population is not None and population > 1:
+        if n >= population:
+            return p, p
+        n = n * (population - 1) / (population - n)
+    z2 = z * z
+    center = (p + z2 / (2 * n)) / (1 + z2 / n)
+    half = z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def format_result(result):
+    text = f"{result['accuracy'] * 100:.2f}%"
+    if result["count"] < result["population"]:
+        text += (
+            f" (95% CI {result['low'] * 100:.2f}-{result['high'] * 100:.2f}%, "
+            f"n={result['count']})"
+        )
+    return text
+
+
+class Evaluator:
+    """
+    Accuracy of a network on one dataset through large inference-only
+    batches. With subsample set, every evaluate() scores the same
+    stratified subset of that size and returns a 95% interval for the
+    accuracy on the full set, for cheap per-epoch estimates.
+    """
+
+    def __init__(self, X, y, subsample=None, batch_size=DEFAULT_BATCH_SIZE, seed=0):
+        self.population = len(y)
+        self.batch_size = batch_size
+        if subsample is not None and subsample < len(y):
+            # Gathered once, so each evaluation reads contiguous batches
+            indices = stratified_subsample(y, subsample, seed)
+            X, y = X[indices], y[indices]
+        self.X = X
+        self.y = y
+
+    def evaluate(self, net):
+        n = len(self.y)
+        correct = count_correct(net, self.X, self.y, self.batch_size)
+        low, high = wilson_interval(correct, n, population=self.population)
+        return {
+            "accuracy": correct / n if n else 0.0,
+            "low": low,
+            "high": high,
+            "correct": correct,
+            "count": n,
+            "population": self.population,
+        }
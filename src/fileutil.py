@@ -0,0 +1,24 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="w"):
+    """
+    A file to write `path` through: it is a temporary file beside `path`,
+    fsynced and renamed over `path` once the block completes, so readers
+    see either the old contents or all of the new ones. On error the
+    temporary file is removed and `path` is left untouched.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -4,6 +4,12 @@ import threading
 import time
 import numpy as np
 from src.network import Network  # Ensure this matches your directory structure
+from src.checkpoint import Checkpointer, TerminationFlag, resume_position
+from src.data import load_mnist_data
+from src.evaluate import DEFAULT_BATCH_SIZE, count_correct
+from src.loader import PrefetchLoader
+from src.optim import make_optimizer
+from src.sampler import BatchLoader, ShuffledSampler
 
 
 class TrainingManager:
@@ -17,6 +23,10 @@ class TrainingManager:
         self.max_epochs = 5
         self.batch_size = 64
         self.learning_rate = 0.01
+        self.optimizer_name = "sgd"
+        self.checkpoint_dir = "checkpoints"
+        self.checkpoint_every = 200
+        self.resume_from_checkpoint = True
         self.start_time = time.time()
 
         # New attributes for progress tracking
@@ -41,6 +51,8 @@ class DigitApp:
 
         self.net = Network()
         self.training_manager = TrainingManager()
+        self.checkpointer = Checkpointer(self.training_manager.checkpoint_dir)
+        self.termination = TerminationFlag(on_signal=self.on_sigterm)
 
         # Main layout: Split into left stats panel and right main display
         main_frame = tk.Frame(master)
@@ -74,6 +86,26 @@ class DigitApp:
         self.lr_entry.insert(0, "0.01")
         self.lr_entry.grid(row=0, column=5)
 
+        tk.Label(control_frame, text="Optimizer:").grid(row=0, column=6, sticky="e")
+        self.optimizer_choice = ttk.Combobox(
+            control_frame,
+            width=9,
+            state="readonly",
+            values=["sgd", "momentum", "adam", "adamw"],
+        )
+        self.optimizer_choice.set("sgd")
+        self.optimizer_choice.grid(row=0, column=7)
+
+        self.resume_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            control_frame, text="Resume from checkpoint", variable=self.resume_var
+        ).grid(row=0, column=8, padx=5)
+
+        self.profile_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            control_frame, text="Profile layers", variable=self.profile_var
+        ).grid(row=1, column=5, columnspan=2, sticky="w")
+
         # Buttons
         self.start_button = tk.Button(
             control_frame, text="Start", command=self.start_training
@@ -167,6 +199,14 @@ class DigitApp:
         self.stats_lr.pack(anchor="w")
         self.stats_time = tk.Label(stats_frame, text="Elapsed Time: 0s", bg="#f0f0f0")
         self.stats_time.pack(anchor="w")
+        self.stats_profile = tk.Label(
+            stats_frame,
+            text="",
+            bg="#f0f0f0",
+            justify=tk.LEFT,
+            font=("Courier", 8),
+        )
+        self.stats_profile.pack(anchor="w", pady=5)
 
         # DO NOT call self.update_architecture_display() here.
         # We'll call it after a dummy forward pass in main.py.
@@ -174,6 +214,11 @@ class DigitApp:
         # Update GUI status periodically
         self.update_gui_status()
 
+        # Decode (or map) the dataset cache now, so Start trains immediately
+        self.data = None
+        self.data_ready = threading.Event()
+        threading.Thread(target=self.warm_data_cache, daemon=True).start()
+
     def update_architecture_display(self):
         self.arch_text.delete("1.0", tk.END)
         self.arch_canvas.delete("all")
@@ -341,6 +386,13 @@ class DigitApp:
             self.training_manager.max_epochs = 5
             self.training_manager.batch_size = 64
             self.training_manager.learning_rate = 0.01
+        self.training_manager.optimizer_name = self.optimizer_choice.get()
+        self.training_manager.resume_from_checkpoint = self.resume_var.get()
+        if self.profile_var.get():
+            if self.net.profiler is None:
+                self.net.enable_profiling(window=50)
+        else:
+            self.net.disable_profiling()
 
         self.training_manager.stop_requested = False
         self.training_manager.pause_requested = False
@@ -370,10 +422,26 @@ class DigitApp:
         test_thread = threading.Thread(target=self.compute_and_show_accuracy)
         test_thread.start()
 
-    def compute_and_show_accuracy(self):
-        from src.data import load_mnist_data
+    def warm_data_cache(self):
+        start = time.time()
+        try:
+            # Full checksums run here, off the training path
+            self.data = load_mnist_data(verify=True)
+            message = f"Dataset ready in {time.time() - start:.1f}s\n"
+        except Exception as e:
+            message = f"Dataset not cached: {e}\n"
+        self.data_ready.set()
+        self.master.after(0, lambda: self.history_text.insert(tk.END, message))
+
+    def load_data(self):
+        # The warmed arrays, or a direct load if warming failed
+        self.data_ready.wait()
+        if self.data is None:
+            self.data = load_mnist_data()
+        return self.data
 
-        X_train, y_train, X_test, y_test = load_mnist_data()
+    def compute_and_show_accuracy(self):
+        X_train, y_train, X_test, y_test = self.load_data()
         acc = self.compute_accuracy(X_test, y_test)
 
         def show_result():
@@ -382,59 +450,97 @@ class DigitApp:
 
         self.master.after(0, show_result)
 
-    def compute_accuracy(self, X, y, batch_size=100):
-        N = X.shape[0]
-        correct = 0
-        for start_idx in range(0, N, batch_size):
-            end_idx = start_idx + batch_size
-            X_batch = X[start_idx:end_idx]
-            y_batch = y[start_idx:end_idx]
-            out = self.net.forward(X_batch)
-            preds = np.argmax(out, axis=1)
-            correct += np.sum(preds == y_batch)
-        return correct / N
+    def compute_accuracy(self, X, y, batch_size=DEFAULT_BATCH_SIZE):
+        return count_correct(self.net, X, y, batch_size) / X.shape[0]
 
     def training_loop(self):
-        from src.data import load_mnist_data
-
-        X_train, y_train, X_test, y_test = load_mnist_data()
+        X_train, y_train, X_test, y_test = self.load_data()
         tm = self.training_manager
-        tm.num_batches = X_train.shape[0] // tm.batch_size
+        sampler = ShuffledSampler(X_train.shape[0])
+        loader = PrefetchLoader(BatchLoader(X_train, y_train, sampler, tm.batch_size))
+        tm.num_batches = loader.num_batches
+        self.net.compile(loader.X_buffer.shape)
+        optimizer = make_optimizer(tm.optimizer_name, self.net, tm.learning_rate)
+
+        first_epoch, first_batch = 1, 0
+        if tm.resume_from_checkpoint:
+            try:
+                state = self.checkpointer.load(optimizer)
+            except ValueError as e:
+                state = None
+                self.history_text.insert(tk.END, f"Not resuming: {e}\n")
+            if state is not None:
+                first_epoch, first_batch = resume_position(state, tm.batch_size)
+                if state["order"] is not None:
+                    try:
+                        sampler.restore_order(state["order"])
+                    except ValueError as e:
+                        self.history_text.insert(tk.END, f"Cannot resume: {e}\n")
+                        tm.is_training = False
+                        return
+                if first_epoch > tm.max_epochs:
+                    message = (
+                        f"{state['path']} is the end of a completed "
+                        f"{tm.max_epochs}-epoch run; untick 'Resume from "
+                        "checkpoint' to train a new one\n"
+                    )
+                else:
+                    message = (
+                        f"Resumed at epoch {first_epoch}, batch {first_batch} "
+                        f"from {state['path']}\n"
+                    )
+                self.history_text.insert(tk.END, message)
+
+        def save_checkpoint(epoch, batch, block=False):
+            self.checkpointer.save(
+                optimizer,
+                epoch,
+                batch,
+                sampler.order,
+                {"batch_size": tm.batch_size},
+                block=block,
+            )
 
-        for epoch in range(1, tm.max_epochs + 1):
+        for epoch in range(first_epoch, tm.max_epochs + 1):
             if tm.stop_requested:
                 break
             tm.current_epoch = epoch
 
-            indices = np.arange(X_train.shape[0])
-            np.random.shuffle(indices)
-            X_train = X_train[indices]
-            y_train = y_train[indices]
+            start_batch = first_batch if epoch == first_epoch else 0
+            if start_batch == 0:
+                sampler.new_epoch()
 
-            for i in range(tm.num_batches):
+            seen = correct = 0
+            stopped = False
+            for i, X_batch, y_batch in loader.batches(start_batch):
                 if tm.stop_requested:
+                    save_checkpoint(epoch, i, block=True)
+                    stopped = True
                     break
                 while tm.pause_requested and not tm.stop_requested:
                     time.sleep(0.1)
 
-                start = i * tm.batch_size
-                end = start + tm.batch_size
-                X_batch = X_train[start:end]
-                y_batch = y_train[start:end]
-
                 loss = self.net.loss_and_backward(X_batch, y_batch)
-                # Update parameters
-                for layer in self.net.layers:
-                    if hasattr(layer, "W"):
-                        layer.W -= tm.learning_rate * layer.dW
-                    if hasattr(layer, "b"):
-                        layer.b -= tm.learning_rate * layer.db
+                optimizer.step()
+                if self.net.profiler is not None:
+                    self.net.profiler.end_step()
+                correct += self.net.last_correct
+                seen += len(y_batch)
 
                 tm.current_batch = i + 1
                 tm.current_loss = loss
+                if (i + 1) % tm.checkpoint_every == 0:
+                    save_checkpoint(epoch, i + 1)
+
+            if stopped:
+                break
+            # Also reached when Stop came during the last batch, so the
+            # epoch's final batches are kept; the next epoch then stops
+            save_checkpoint(epoch + 1, 0)
 
-            # After each epoch, compute training accuracy
-            train_acc = self.compute_accuracy(X_train, y_train)
+            # Running training accuracy of this epoch, counted during the
+            # training steps instead of a separate pass over X_train
+            train_acc = correct / seen if seen else 0.0
             tm.train_accuracies.append(train_acc)
             tm.train_losses.append(tm.current_loss)
 
@@ -445,11 +551,22 @@ class DigitApp:
             )
             self.history_text.see(tk.END)
 
-            if tm.stop_requested:
-                break
-
+        self.checkpointer.wait()
         tm.is_training = False
 
+    def on_sigterm(self):
+        # Stop at the next batch boundary (which checkpoints), then close
+        self.training_manager.request_stop()
+
+        def close_when_saved():
+            if self.training_manager.is_training:
+                self.master.after(100, close_when_saved)
+            else:
+                self.checkpointer.close()
+                self.master.destroy()
+
+        self.master.after(0, close_when_saved)
+
     def update_gui_status(self):
         tm = self.training_manager
 
@@ -486,9 +603,17 @@ class DigitApp:
         else:
             self.stats_acc.config(text="Current Accuracy: N/A")
 
-        self.stats_lr.config(text=f"Learning Rate: {tm.learning_rate}")
+        self.stats_lr.config(
+            text=f"Learning Rate: {tm.learning_rate} ({tm.optimizer_name})"
+        )
         elapsed = int(time.time() - tm.start_time)
         self.stats_time.config(text=f"Elapsed Time: {elapsed}s")
+        if self.net.profiler is not None and self.net.profiler.order:
+            self.stats_profile.config(
+                text="Slowest layers:\n" + self.net.profiler.summary(top=5)
+            )
+        else:
+            self.stats_profile.config(text="")
 
         # Update weights stats if available
         if hasattr(self.net.layers[-1], "W"):
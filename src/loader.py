@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class PrefetchLoader:
+    """
+    Wraps a src.sampler.BatchLoader so batches are gathered (and passed
+    through its transform, if any) on a background thread, up to `depth`
+    batches ahead of training, into a ring of depth + 1 reused buffers.
+    The consumer only swaps buffers: a batch it was handed stays valid
+    until it asks for the next one, and the slot then goes back to the
+    producer. NumPy releases the GIL while copying, so gathering overlaps
+    with the training step.
+
+    wait_time accumulates the seconds the consumer spent blocked on the
+    producer; if it is a noticeable share of the epoch, training is
+    input-bound.
+    """
+
+    def __init__(self, loader, depth=2):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.loader = loader
+        self.depth = depth
+        self.slots = [(loader.X_buffer, loader.y_buffer)] + [
+            (np.empty_like(loader.X_buffer), np.empty_like(loader.y_buffer))
+            for _ in range(depth)
+        ]
+        self.reset_stats()
+
+    @property
+    def sampler(self):
+        return self.loader.sampler
+
+    @property
+    def num_batches(self):
+        return self.loader.num_batches
+
+    @property
+    def X_buffer(self):
+        return self.loader.X_buffer
+
+    def reset_stats(self):
+        self.wait_time = 0.0
+        self.batches_served = 0
+
+    def stats(self):
+        n = max(self.batches_served, 1)
+        return {
+            "batches": self.batches_served,
+            "wait_s": self.wait_time,
+            "wait_ms_per_batch": self.wait_time / n * 1e3,
+        }
+
+    def _produce(self, start_batch, free, ready, stop):
+        try:
+            for i in range(start_batch, self.loader.num_batches):
+                slot = free.get()
+                if stop.is_set():
+                    return
+                self.loader.load(i, *self.slots[slot])
+                ready.put((i, slot))
+        except BaseException as e:  # re-raised on the training thread
+            ready.put(e)
+            return
+        ready.put(None)
+
+    def batches(self, start_batch=0):
+        # (i, X_batch, y_batch) for the rest of the current epoch
+        free = queue.Queue()
+        for slot in range(len(self.slots)):
+            free.put(slot)
+        ready = queue.Queue()
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce,
+            args=(start_batch, free, ready, stop),
+            name="batch-prefetch",
+            daemon=True,
+        )
+        producer.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = ready.get()
+                self.wait_time += time.perf_counter() - start
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                i, slot = item
+                self.batches_served += 1
+                X_batch, y_batch = self.slots[slot]
+                yield i, X_batch, y_batch
+                free.put(slot)
+        finally:
+            # Also reached when the consumer stops early: release the producer
+            stop.set()
+            free.put(None)
+            producer.join()
@@ -1,3 +1,7 @@
+import copy
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import numpy as np
 
 
@@ -9,37 +13,102 @@ def one_hot(labels, num_classes=10):
     return one_hot_labels
 
 
-def im2col(X, kernel_size, stride, padding):
+class Workspace:
+    """
+    Cache of scratch buffers reused across steps. Buffers are keyed by
+    name plus the shape/kernel/stride/padding signature that produced
+    them, and the least recently used entries are dropped once more than
+    max_entries signatures are alive (e.g. train and eval batch sizes).
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.buffers = OrderedDict()
+
+    def get(self, key, shape, dtype, zero=False):
+        key = (key, tuple(shape), np.dtype(dtype))
+        buf = self.buffers.get(key)
+        if buf is not None:
+            self.buffers.move_to_end(key)
+            return buf
+        buf = np.zeros(shape, dtype=dtype) if zero else np.empty(shape, dtype=dtype)
+        self.buffers[key] = buf
+        while len(self.buffers) > self.max_entries:
+            self.buffers.popitem(last=False)
+        return buf
+
+    def clear(self):
+        self.buffers.clear()
+
+
+def conv_windows(X_padded, kernel_size, stride, H_out, W_out):
+    # Strided (N, H_out, W_out, C, KH, KW) view of every receptive field
+    N, C, _, _ = X_padded.shape
+    sN, sC, sH, sW = X_padded.strides
+    return np.lib.stride_tricks.as_strided(
+        X_padded,
+        shape=(N, H_out, W_out, C, kernel_size, kernel_size),
+        strides=(sN, sH * stride, sW * stride, sC, sH, sW),
+        writeable=False,
+    )
+
+
+def pad_input(X, padding, workspace=None, key="pad"):
+    if padding == 0:
+        return X
+    N, C, H, W = X.shape
+    if workspace is None:
+        return np.pad(
+            X, ((0, 0), (0, 0), (padding, padding), (padding, padding)), mode="constant"
+        )
+    # Borders are zeroed once at allocation and never written afterwards
+    X_padded = workspace.get(
+        (key, padding), (N, C, H + 2 * padding, W + 2 * padding), X.dtype, zero=True
+    )
+    X_padded[:, :, padding : padding + H, padding : padding + W] = X
+    return X_padded
+
+
+def im2col(X, kernel_size, stride, padding, workspace=None):
+    """
+    (N, C, H, W) -> (N * H_out * W_out, C * KH * KW). With a workspace the
+    result is written into a reused buffer that stays valid only until the
+    next call with the same signature.
+    """
     N, C, H, W = X.shape
     KH, KW = kernel_size, kernel_size
     H_out = (H + 2 * padding - KH) // stride + 1
     W_out = (W + 2 * padding - KW) // stride + 1
 
-    # Pad input
-    X_padded = np.pad(
-        X, ((0, 0), (0, 0), (padding, padding), (padding, padding)), mode="constant"
-    )
-    col = np.zeros((N, C, KH, KW, H_out, W_out))
-
-    for y in range(KH):
-        y_max = y + stride * H_out
-        for x in range(KW):
-            x_max = x + stride * W_out
-            col[:, :, y, x, :, :] = X_padded[:, :, y:y_max:stride, x:x_max:stride]
+    X_padded = pad_input(X, padding, workspace, key="im2col_pad")
+    windows = conv_windows(X_padded, kernel_size, stride, H_out, W_out)
 
-    # (N, C, KH, KW, H_out, W_out) -> (N * H_out * W_out, C * KH * KW)
-    col = col.transpose(0, 4, 5, 1, 2, 3).reshape(N * H_out * W_out, -1)
-    return col
+    if workspace is None:
+        col = np.empty(windows.shape, dtype=X.dtype)
+    else:
+        col = workspace.get(
+            ("im2col_col", kernel_size, stride, padding), windows.shape, X.dtype
+        )
+    np.copyto(col, windows)
+    return col.reshape(N * H_out * W_out, -1)
 
 
-def col2im(col, X_shape, kernel_size, stride, padding):
+def col2im(col, X_shape, kernel_size, stride, padding, workspace=None):
     N, C, H, W = X_shape
     KH, KW = kernel_size, kernel_size
     H_out = (H + 2 * padding - KH) // stride + 1
     W_out = (W + 2 * padding - KW) // stride + 1
 
+    # (N, H_out, W_out, C, KH, KW) -> (N, C, KH, KW, H_out, W_out) view
     col = col.reshape(N, H_out, W_out, C, KH, KW).transpose(0, 3, 4, 5, 1, 2)
-    X_padded = np.zeros((N, C, H + 2 * padding, W + 2 * padding))
+    padded_shape = (N, C, H + 2 * padding, W + 2 * padding)
+    if workspace is None:
+        X_padded = np.zeros(padded_shape, dtype=col.dtype)
+    else:
+        X_padded = workspace.get(
+            ("col2im_pad", kernel_size, stride, padding), padded_shape, col.dtype
+        )
+        X_padded.fill(0)
 
     for y in range(KH):
         y_max = y + stride * H_out
@@ -52,162 +121,604 @@ def col2im(col, X_shape, kernel_size, stride, padding):
     return X_padded
 
 
-class ConvLayer:
-    def __init__(self, in_channels, out_channels, kernel_size=3, stride=1, padding=0):
+class DTypePolicy:
+    """
+    Precision policy shared by all layers of a Network.
+
+    compute_dtype is used for activations and GEMMs, param_dtype for the
+    stored weights, accum_dtype for gradients, and storage_dtype for the
+    activations a layer keeps around for its backward pass.
+    """
+
+    def __init__(
+        self,
+        compute_dtype=np.float32,
+        param_dtype=np.float32,
+        accum_dtype=np.float32,
+        storage_dtype=None,
+    ):
+        self.compute_dtype = np.dtype(compute_dtype)
+        self.param_dtype = np.dtype(param_dtype)
+        self.accum_dtype = np.dtype(accum_dtype)
+        if storage_dtype is None:
+            storage_dtype = compute_dtype
+        self.storage_dtype = np.dtype(storage_dtype)
+
+    @classmethod
+    def mixed(cls):
+        # float16 saved activations, float32 everything else
+        return cls(storage_dtype=np.float16)
+
+    def store(self, X, workspace=None, key="store"):
+        # Convert an activation saved for backward to storage_dtype
+        return self._convert(X, self.storage_dtype, workspace, key)
+
+    def restore(self, X, workspace=None, key="restore"):
+        # Bring a saved activation back to accum_dtype for the backward GEMMs
+        return self._convert(X, self.accum_dtype, workspace, key)
+
+    def _convert(self, X, dtype, workspace, key):
+        if X.dtype == dtype:
+            return X
+        if workspace is None:
+            return X.astype(dtype)
+        out = workspace.get(key, X.shape, dtype)
+        np.copyto(out, X, casting="unsafe")
+        return out
+
+    def __repr__(self):
+        return (
+            f"DTypePolicy(compute={self.compute_dtype}, param={self.param_dtype}, "
+            f"accum={self.accum_dtype}, storage={self.storage_dtype})"
+        )
+
+
+DEFAULT_POLICY = DTypePolicy()
+
+
+class Layer:
+    policy = DEFAULT_POLICY
+
+    # Memory planner hints: whether forward/backward honour a preallocated
+    # flat `out` buffer, whether the output is a view of the input, and
+    # whether the input must stay alive until this layer's backward
+    forward_out = False
+    backward_out = False
+    output_is_view = False
+    saves_input = False
+
+    def infer(self, X):
+        # Inference-only forward; layers override it to skip saving state
+        return self.forward(X)
+
+    def output_shape(self, input_shape):
+        return input_shape
+
+    def replicate(self):
+        # Shallow copy sharing W/b but with its own gradients and workspaces
+        clone = copy.copy(self)
+        for name in ("dW", "db"):
+            clone.__dict__.pop(name, None)
+        for name, value in vars(self).items():
+            if isinstance(value, Workspace):
+                setattr(clone, name, Workspace(value.max_entries))
+        return clone
+
+    def grad_buffer(self, name, shape):
+        # Parameter gradients are written in place into persistent buffers
+        buf = getattr(self, name, None)
+        dtype = self.policy.accum_dtype
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            setattr(self, name, buf)
+        return buf
+
+    def set_policy(self, policy):
+        self.policy = policy
+        for name in ("W", "b"):
+            if hasattr(self, name):
+                setattr(self, name, getattr(self, name).astype(policy.param_dtype))
+
+
+class ConvLayer(Layer):
+    forward_out = True
+
+    def __init__(
+        self,
+        in_channels,
+        out_channels,
+        kernel_size=3,
+        stride=1,
+        padding=0,
+        algorithm="im2col",
+    ):
         # Xavier initialization for filters
         limit = np.sqrt(6.0 / (in_channels * kernel_size * kernel_size))
         self.W = np.random.uniform(
             -limit, limit, (out_channels, in_channels, kernel_size, kernel_size)
-        )
-        self.b = np.zeros((out_channels,))
+        ).astype(self.policy.param_dtype)
+        self.b = np.zeros((out_channels,), dtype=self.policy.param_dtype)
         self.stride = stride
         self.padding = padding
         self.kernel_size = kernel_size
         self.out_channels = out_channels
         self.out_height = None
         self.out_width = None
-
-    def forward(self, X):
-        self.X = X
+        self.workspace = Workspace()
+        # Separate buffers so evaluation never clobbers state kept for backward
+        self.infer_workspace = Workspace()
+        # A name from src.conv_algos.CONV_ALGORITHMS, or "auto" to autotune
+        self.algorithm = algorithm
+        self.algorithms = {}
+
+    def _algorithm_for(self, X, mode):
+        key = (mode, X.shape, X.dtype)
+        algorithm = self.algorithms.get(key)
+        if algorithm is None:
+            from src.conv_algos import select_algorithm
+
+            algorithm = select_algorithm(self, X, mode)
+            self.algorithms[key] = algorithm
+        return algorithm
+
+    def _gemm(self, X, workspace, out=None, mode="train"):
+        # Convolution + bias as an (N * H_out * W_out, K) NHWC matrix;
+        # also returns the im2col matrix when the algorithm built one
         N, C, H, W = X.shape
-        out_channels, _, KH, KW = self.W.shape
+        H_out, W_out = self.output_size(H, W)
+        compute_dtype = self.policy.compute_dtype
+        W_compute = self.W.astype(compute_dtype, copy=False)
+
+        if out is None:
+            out = np.empty((N * H_out * W_out, self.out_channels), dtype=compute_dtype)
+        out = out.reshape(N * H_out * W_out, self.out_channels)
+        if self.algorithm == "im2col":
+            col = self._im2col_gemm(X, W_compute, workspace, out)
+        else:
+            algorithm = self._algorithm_for(X, mode)
+            col = algorithm.forward(self, X, W_compute, workspace, out)
+        out += self.b.astype(compute_dtype, copy=False)
+        return col, out, W_compute.reshape(self.out_channels, -1)
+
+    def _im2col_gemm(self, X, W, workspace, out):
+        col = im2col(X, self.kernel_size, self.stride, self.padding, workspace)
+        np.dot(col, W.reshape(self.out_channels, -1).T, out=out)
+        return col
+
+    def _save_for_backward(self, X, col, W_reshaped):
+        self.X_shape = X.shape
+        if col is not None:
+            self.col = self.policy.store(col, self.workspace, "col_store")
+            self.X_saved = None
+        else:
+            # Algorithms without a col matrix rebuild it from X in backward
+            self.col = None
+            X_saved = self.workspace.get("x_saved", X.shape, self.policy.storage_dtype)
+            np.copyto(X_saved, X, casting="unsafe")
+            self.X_saved = X_saved
+        self.W_reshaped = W_reshaped
 
-        self.col = im2col(X, KH, self.stride, self.padding)
-        W_reshaped = self.W.reshape(out_channels, -1)
+    def output_shape(self, input_shape):
+        N, C, H, W = input_shape
+        return (N, self.out_channels) + self.output_size(H, W)
 
-        out = self.col.dot(W_reshaped.T) + self.b
-        H_out = (H + 2 * self.padding - KH) // self.stride + 1
-        W_out = (W + 2 * self.padding - KW) // self.stride + 1
-        out = out.reshape(N, H_out, W_out, out_channels).transpose(0, 3, 1, 2)
+    def output_size(self, H, W):
+        H_out = (H + 2 * self.padding - self.kernel_size) // self.stride + 1
+        W_out = (W + 2 * self.padding - self.kernel_size) // self.stride + 1
+        return H_out, W_out
 
-        self.W_reshaped = W_reshaped
+    def forward(self, X, out=None):
+        N, C, H, W = X.shape
+        col, out, W_reshaped = self._gemm(X, self.workspace, out)
+        H_out, W_out = self.output_size(H, W)
+        out = out.reshape(N, H_out, W_out, self.out_channels).transpose(0, 3, 1, 2)
+
+        self._save_for_backward(X, col, W_reshaped)
         self.out_height = H_out
         self.out_width = W_out
         return out
 
-    def backward(self, dOut):
+    def backward(self, dOut, out=None):
         N, C_out, H_out, W_out = dOut.shape
-        out_channels, in_channels, KH, KW = self.W.shape
+        dOut_reshaped = self.workspace.get(
+            "dout", (N, H_out, W_out, C_out), self.policy.accum_dtype
+        )
+        np.copyto(dOut_reshaped, dOut.transpose(0, 2, 3, 1), casting="unsafe")
+        return self._backward_gemm(dOut_reshaped.reshape(-1, C_out))
+
+    def _backward_gemm(self, dOut_reshaped):
+        # dOut_reshaped is (N * H_out * W_out, K) in accum_dtype
+        KH = self.kernel_size
+        accum_dtype = self.policy.accum_dtype
+        if self.col is None:
+            X = self.policy.restore(self.X_saved, self.workspace, "x_restore")
+            col = im2col(X, KH, self.stride, self.padding, self.workspace)
+        else:
+            col = self.policy.restore(self.col, self.workspace, "col_restore")
+        K = dOut_reshaped.shape[1]
+        np.sum(dOut_reshaped, axis=0, out=self.grad_buffer("db", self.b.shape))
+        dW = self.grad_buffer("dW", self.W.shape)
+        np.dot(dOut_reshaped.T, col, out=dW.reshape(K, -1))
+
+        W_reshaped = self.W_reshaped.astype(accum_dtype, copy=False)
+        dCol = self.workspace.get("dcol", col.shape, accum_dtype)
+        np.dot(dOut_reshaped, W_reshaped, out=dCol)
+        dX = col2im(dCol, self.X_shape, KH, self.stride, self.padding, self.workspace)
 
-        dOut_reshaped = dOut.transpose(0, 2, 3, 1).reshape(-1, C_out)
-        self.db = np.sum(dOut_reshaped, axis=0)
-        self.dW = dOut_reshaped.T.dot(self.col).reshape(self.W.shape)
+        return dX
 
-        dCol = dOut_reshaped.dot(self.W_reshaped)
-        dX = col2im(dCol, self.X.shape, KH, self.stride, self.padding)
+    def infer(self, X):
+        N, C, H, W = X.shape
+        _, out, _ = self._gemm(X, self.infer_workspace, mode="infer")
+        H_out, W_out = self.output_size(H, W)
+        return out.reshape(N, H_out, W_out, self.out_channels).transpose(0, 3, 1, 2)
 
-        return dX
 
+class ReLULayer(Layer):
+    forward_out = True
+    backward_out = True
+    saves_input = True
 
-class ReLULayer:
-    def forward(self, X):
-        self.X = X
+    def forward(self, X, out=None):
+        self.X = self.policy.store(X)
         self.out_shape = X.shape  # Store shape for printing
+        if out is not None:
+            out = out.reshape(X.shape)
+        return np.maximum(0, X, out=out)
+
+    def backward(self, dOut, out=None):
+        dOut = dOut.astype(self.policy.accum_dtype, copy=False)
+        if out is not None:
+            out = out.reshape(dOut.shape)
+        dX = np.multiply(dOut, self.X > 0, out=out)
+        return dX
+
+    def infer(self, X):
         return np.maximum(0, X)
 
-    def backward(self, dOut):
-        dX = dOut * (self.X > 0)
-        return dX
 
+def pool_windows(X, pool_size, stride):
+    # Strided (N, C, HH, WW, pool_size, pool_size) view of the pooling windows
+    N, C, H, W = X.shape
+    HH = (H - pool_size) // stride + 1
+    WW = (W - pool_size) // stride + 1
+    sN, sC, sH, sW = X.strides
+    return np.lib.stride_tricks.as_strided(
+        X,
+        shape=(N, C, HH, WW, pool_size, pool_size),
+        strides=(sN, sC, sH * stride, sW * stride, sH, sW),
+        writeable=False,
+    )
 
-class MaxPoolLayer:
+
+class MaxPoolLayer(Layer):
     def __init__(self, pool_size=2, stride=2):
         self.pool_size = pool_size
         self.stride = stride
 
-    def forward(self, X):
-        self.X = X
+    def output_shape(self, input_shape):
+        N, C, H, W = input_shape
+        HH = (H - self.pool_size) // self.stride + 1
+        WW = (W - self.pool_size) // self.stride + 1
+        return (N, C, HH, WW)
+
+    def forward(self, X, out=None):
+        self.X_shape = X.shape
         N, C, H, W = X.shape
-        HH = H // self.pool_size
-        WW = W // self.pool_size
-
-        out = np.zeros((N, C, HH, WW))
-        self.max_indices = np.zeros((N, C, HH, WW, 2), dtype=int)
-
-        for n in range(N):
-            for c in range(C):
-                for i in range(HH):
-                    for j in range(WW):
-                        region = X[
-                            n,
-                            c,
-                            i * self.stride : i * self.stride + self.pool_size,
-                            j * self.stride : j * self.stride + self.pool_size,
-                        ]
-                        max_val = np.max(region)
-                        out[n, c, i, j] = max_val
-                        idx = np.unravel_index(np.argmax(region), region.shape)
-                        self.max_indices[n, c, i, j] = [
-                            idx[0] + i * self.stride,
-                            idx[1] + j * self.stride,
-                        ]
+        p = self.pool_size
+        HH = (H - p) // self.stride + 1
+        WW = (W - p) // self.stride + 1
+
+        if self.stride == p:
+            # Non-overlapping windows: crop and split the spatial axes
+            windows = X[:, :, : HH * p, : WW * p].reshape(N, C, HH, p, WW, p)
+            windows = windows.transpose(0, 1, 2, 4, 3, 5)
+        else:
+            windows = pool_windows(X, p, self.stride)
+
+        # Flatten each window row-major so argmax keeps the first maximum
+        windows = windows.reshape(N, C, HH, WW, p * p)
+        self.max_indices = np.argmax(windows, axis=4)
+        out = np.take_along_axis(windows, self.max_indices[..., None], axis=4)[..., 0]
 
         self.out_channels = C
         self.out_height = HH
         self.out_width = WW
         return out
 
-    def backward(self, dOut):
+    def backward(self, dOut, out=None):
+        dOut = dOut.astype(self.policy.accum_dtype, copy=False)
         N, C, HH, WW = dOut.shape
-        dX = np.zeros_like(self.X)
+        _, _, H, W = self.X_shape
+        p = self.pool_size
+
+        if self.stride == p:
+            # Every input position belongs to at most one window
+            dWindows = np.zeros((N, C, HH, WW, p * p), dtype=dOut.dtype)
+            np.put_along_axis(dWindows, self.max_indices[..., None], dOut[..., None], 4)
+            dWindows = dWindows.reshape(N, C, HH, WW, p, p).transpose(0, 1, 2, 4, 3, 5)
+            dX = np.zeros(self.X_shape, dtype=dOut.dtype)
+            dX[:, :, : HH * p, : WW * p] = dWindows.reshape(N, C, HH * p, WW * p)
+            return dX
+
+        # Overlapping windows: one scatter-add, in the same order as the loops
+        rows = self.max_indices // p + (np.arange(HH) * self.stride)[:, None]
+        cols = self.max_indices % p + np.arange(WW) * self.stride
+        base = (np.arange(N * C) * (H * W)).reshape(N, C, 1, 1)
+        flat = base + rows * W + cols
+        dX = np.zeros(N * C * H * W, dtype=dOut.dtype)
+        np.add.at(dX, flat.ravel(), dOut.ravel())
+        return dX.reshape(self.X_shape)
+
+    def infer(self, X):
+        # Max only: no argmax bookkeeping for backward
+        N, C, H, W = X.shape
+        p = self.pool_size
+        if self.stride == p:
+            HH, WW = H // p, W // p
+            windows = X[:, :, : HH * p, : WW * p].reshape(N, C, HH, p, WW, p)
+            return windows.max(axis=(3, 5))
+        return pool_windows(X, p, self.stride).max(axis=(4, 5))
 
-        for n in range(N):
-            for c in range(C):
-                for i in range(HH):
-                    for j in range(WW):
-                        (max_i, max_j) = self.max_indices[n, c, i, j]
-                        dX[n, c, max_i, max_j] += dOut[n, c, i, j]
 
-        return dX
+class FlattenLayer(Layer):
+    output_is_view = True
 
+    def output_shape(self, input_shape):
+        return (input_shape[0], int(np.prod(input_shape[1:])))
 
-class FlattenLayer:
-    def forward(self, X):
+    def forward(self, X, out=None):
         self.X_shape = X.shape
         N, C, H, W = X.shape
         self.out_dim = C * H * W
         return X.reshape(N, -1)
 
-    def backward(self, dOut):
+    def backward(self, dOut, out=None):
         return dOut.reshape(self.X_shape)
 
+    def infer(self, X):
+        return X.reshape(X.shape[0], -1)
+
+
+class FullyConnectedLayer(Layer):
+    forward_out = True
+    backward_out = True
+    saves_input = True
 
-class FullyConnectedLayer:
     def __init__(self, in_dim, out_dim):
         limit = np.sqrt(6.0 / (in_dim + out_dim))
-        self.W = np.random.uniform(-limit, limit, (in_dim, out_dim))
-        self.b = np.zeros((out_dim,))
+        self.W = np.random.uniform(-limit, limit, (in_dim, out_dim)).astype(
+            self.policy.param_dtype
+        )
+        self.b = np.zeros((out_dim,), dtype=self.policy.param_dtype)
         self.out_dim = out_dim
 
-    def forward(self, X):
-        self.X = X
-        return X.dot(self.W) + self.b
+    def output_shape(self, input_shape):
+        return (input_shape[0], self.out_dim)
+
+    def forward(self, X, out=None):
+        compute_dtype = self.policy.compute_dtype
+        self.X = self.policy.store(X)
+        W = self.W.astype(compute_dtype, copy=False)
+        if out is not None:
+            out = out.reshape(X.shape[0], self.out_dim)
+        out = np.dot(X, W, out=out)
+        out += self.b.astype(compute_dtype, copy=False)
+        return out
 
-    def backward(self, dOut):
-        dX = dOut.dot(self.W.T)
-        self.dW = self.X.T.dot(dOut)
-        self.db = np.sum(dOut, axis=0)
+    def backward(self, dOut, out=None):
+        accum_dtype = self.policy.accum_dtype
+        dOut = dOut.astype(accum_dtype, copy=False)
+        if out is not None:
+            out = out.reshape(dOut.shape[0], self.W.shape[0])
+        dX = np.dot(dOut, self.W.astype(accum_dtype, copy=False).T, out=out)
+        X = self.policy.restore(self.X)
+        np.dot(X.T, dOut, out=self.grad_buffer("dW", self.W.shape))
+        np.sum(dOut, axis=0, out=self.grad_buffer("db", self.b.shape))
         return dX
 
+    def infer(self, X):
+        compute_dtype = self.policy.compute_dtype
+        out = X.dot(self.W.astype(compute_dtype, copy=False))
+        out += self.b.astype(compute_dtype, copy=False)
+        return out
 
-class SoftmaxLayer:
-    def forward(self, X):
-        shift_X = X - np.max(X, axis=1, keepdims=True)
-        exp_X = np.exp(shift_X)
-        self.out = exp_X / np.sum(exp_X, axis=1, keepdims=True)
+
+class SoftmaxLayer(Layer):
+    def forward(self, X, out=None):
+        self.out = self.infer(X)
         self.out_dim = X.shape[1]
         return self.out
 
-    def backward(self, dOut):
+    def backward(self, dOut, out=None):
         return dOut
 
+    def infer(self, X):
+        shift_X = X - np.max(X, axis=1, keepdims=True)
+        exp_X = np.exp(shift_X)
+        return exp_X / np.sum(exp_X, axis=1, keepdims=True)
+
+
+class SoftmaxCrossEntropyLoss:
+    """
+    Log-softmax and cross-entropy fused over integer labels. forward()
+    returns the mean loss and its gradient w.r.t. the logits in one pass,
+    using log-sum-exp so the loss stays exact for tiny probabilities.
+    It also counts the rows whose label has the largest logit (ties count
+    as correct) in `correct`, for a running training accuracy.
+    """
 
-class Network:
     def __init__(self):
+        self.workspace = Workspace(max_entries=4)
+        self.correct = 0
+
+    def forward(self, logits, y):
+        N = logits.shape[0]
+        rows = np.arange(N)
+        grad = self.workspace.get("grad", logits.shape, logits.dtype)
+
+        # grad holds exp(logits - max) until it is normalized below
+        shift = np.max(logits, axis=1)
+        np.subtract(logits, shift[:, None], out=grad)
+        target = grad[rows, y]
+        self.correct = int(np.count_nonzero(target >= 0))
+        np.exp(grad, out=grad)
+        sum_exp = np.sum(grad, axis=1)
+        loss = np.mean(np.log(sum_exp) - target)
+
+        # d loss / d logits = (softmax - one_hot) / N
+        grad /= sum_exp[:, None]
+        grad[rows, y] -= 1.0
+        grad /= N
+        return loss, grad
+
+
+class ConvReLUPoolLayer(Layer):
+    """
+    Conv -> ReLU -> MaxPool computed straight from the NHWC GEMM output.
+    Pooling runs before ReLU (max and ReLU commute), so the full-size ReLU
+    output and mask are never built. Parameters and gradients stay on the
+    wrapped ConvLayer, so code that walks Network.layers is unaffected.
+    """
+
+    forward_out = True
+
+    def __init__(self, conv, relu, pool):
+        self.conv = conv
+        self.relu = relu
+        self.pool = pool
+
+    @property
+    def policy(self):
+        return self.conv.policy
+
+    def _window_views(self, nhwc, HH, WW):
+        # One strided (N, HH, WW, K) view per position inside the window
+        p = self.pool.pool_size
+        return [
+            nhwc[:, dy : dy + HH * p : p, dx : dx + WW * p : p, :]
+            for dy in range(p)
+            for dx in range(p)
+        ]
+
+    def _shapes(self, X):
+        N, C, H, W = X.shape
+        H_out, W_out = self.conv.output_size(H, W)
+        p = self.pool.pool_size
+        return N, H_out, W_out, H_out // p, W_out // p
+
+    def output_shape(self, input_shape):
+        N, C, H, W = input_shape
+        H_out, W_out = self.conv.output_size(H, W)
+        p = self.pool.pool_size
+        return (N, self.conv.out_channels, H_out // p, W_out // p)
+
+    def forward(self, X, out=None):
+        conv = self.conv
+        ws = conv.workspace
+        K = conv.out_channels
+        N, H_out, W_out, HH, WW = self._shapes(X)
+        # The raw conv output never leaves the block, so it lives in the workspace
+        gemm_out = ws.get(
+            "fused_gemm", (N * H_out * W_out, K), self.policy.compute_dtype
+        )
+        col, gemm_out, W_reshaped = conv._gemm(X, ws, gemm_out)
+        views = self._window_views(gemm_out.reshape(N, H_out, W_out, K), HH, WW)
+
+        # The result is stored NCHW-contiguous so Flatten stays a view;
+        # pooled is an NHWC-ordered view of it matching the window views
+        if out is None:
+            out = np.empty((N, K, HH, WW), dtype=self.policy.compute_dtype)
+        out = out.reshape(N, K, HH, WW)
+        pooled = out.transpose(0, 2, 3, 1)
+        np.copyto(pooled, views[0])
+
+        # Running max over the window; strict '>' keeps the first maximum
+        argmax = ws.get("fused_argmax", pooled.shape, np.uint8)
+        greater = ws.get("fused_greater", pooled.shape, np.bool_)
+        argmax.fill(0)
+        for k, view in enumerate(views[1:], start=1):
+            np.greater(view, pooled, out=greater)
+            np.copyto(argmax, k, where=greater)
+            np.maximum(pooled, view, out=pooled)
+        self.argmax = argmax
+        self.mask = np.greater(
+            pooled, 0, out=ws.get("fused_mask", pooled.shape, np.bool_)
+        )
+        np.maximum(pooled, 0, out=pooled)
+
+        conv._save_for_backward(X, col, W_reshaped)
+        conv.out_height, conv.out_width = H_out, W_out
+        self.relu.out_shape = (N, K, H_out, W_out)
+        self.pool.out_channels = K
+        self.pool.out_height, self.pool.out_width = HH, WW
+        self.conv_shape = (N, H_out, W_out, K)
+        return out
+
+    def backward(self, dOut, out=None):
+        conv = self.conv
+        ws = conv.workspace
+        N, H_out, W_out, K = self.conv_shape
+        HH, WW = dOut.shape[2], dOut.shape[3]
+        dOut = dOut.transpose(0, 2, 3, 1)
+
+        dConv = ws.get("fused_dconv", self.conv_shape, self.policy.accum_dtype)
+        dConv.fill(0)
+        selected = ws.get("fused_selected", self.argmax.shape, np.bool_)
+        for k, view in enumerate(self._window_views(dConv, HH, WW)):
+            np.equal(self.argmax, k, out=selected)
+            selected &= self.mask
+            np.copyto(view, dOut, where=selected, casting="unsafe")
+        return conv._backward_gemm(dConv.reshape(-1, K))
+
+    def infer(self, X):
+        conv = self.conv
+        K = conv.out_channels
+        N, H_out, W_out, HH, WW = self._shapes(X)
+        gemm_out = conv.infer_workspace.get(
+            "fused_gemm", (N * H_out * W_out, K), self.policy.compute_dtype
+        )
+        _, gemm_out, _ = conv._gemm(X, conv.infer_workspace, gemm_out, "infer")
+        views = self._window_views(gemm_out.reshape(N, H_out, W_out, K), HH, WW)
+        pooled = views[0].copy()
+        for view in views[1:]:
+            np.maximum(pooled, view, out=pooled)
+        np.maximum(pooled, 0, out=pooled)
+        return pooled.transpose(0, 3, 1, 2)
+
+
+def fuse_layers(layers):
+    # Replace every Conv -> ReLU -> non-overlapping MaxPool run with one block
+    fused = []
+    i = 0
+    while i < len(layers):
+        window = layers[i : i + 3]
+        if (
+            len(window) == 3
+            and isinstance(window[0], ConvLayer)
+            and isinstance(window[1], ReLULayer)
+            and isinstance(window[2], MaxPoolLayer)
+            and window[2].stride == window[2].pool_size
+        ):
+            fused.append(ConvReLUPoolLayer(*window))
+            i += 3
+        else:
+            fused.append(layers[i])
+            i += 1
+    return fused
+
+
+class Network:
+    def __init__(self, policy=None, fuse=True, conv_algorithm="im2col"):
         # A simple CNN for MNIST
         self.layers = [
             ConvLayer(
-                in_channels=1, out_channels=8, kernel_size=3, stride=1, padding=1
+                in_channels=1,
+                out_channels=8,
+                kernel_size=3,
+                stride=1,
+                padding=1,
+                algorithm=conv_algorithm,
             ),
             ReLULayer(),
             MaxPoolLayer(pool_size=2, stride=2),
@@ -215,31 +726,194 @@ class Network:
             FullyConnectedLayer(in_dim=8 * 14 * 14, out_dim=10),
             SoftmaxLayer(),
         ]
+        self.loss_layer = SoftmaxCrossEntropyLoss()
+        self.set_policy(policy if policy is not None else DTypePolicy())
+        self.training = True
+
+        # Execution order; the layer list itself stays unfused for inspection
+        self.fuse = fuse
+        self.exec_layers = fuse_layers(self.layers) if fuse else list(self.layers)
+        self.memory_plan = None
+        # A src.profiler.LayerProfiler while profiling is enabled
+        self.profiler = None
+        self.last_correct = 0
+
+    def parameters(self):
+        # (layer, name) for every trainable array, in a stable order
+        return [
+            (layer, name)
+            for layer in self.layers
+            for name in ("W", "b")
+            if hasattr(layer, name)
+        ]
+
+    def replicate(self):
+        """
+        Copy of the network whose layers share this network's parameter
+        arrays but keep private activations, gradients and workspaces, so
+        several replicas can run forward/backward concurrently.
+        """
+        replica = copy.copy(self)
+        replica.layers = [layer.replicate() for layer in self.layers]
+        if self.fuse:
+            replica.exec_layers = fuse_layers(replica.layers)
+        else:
+            replica.exec_layers = list(replica.layers)
+        replica.loss_layer = SoftmaxCrossEntropyLoss()
+        replica.memory_plan = None
+        replica.training = True
+        return replica
+
+    def set_policy(self, policy):
+        # Apply one dtype policy to every layer and cast existing parameters
+        self.policy = policy
+        for layer in self.layers:
+            layer.set_policy(policy)
 
     def forward(self, X):
         # Store input shape the first time forward is called
         if not hasattr(self, "input_shape"):
             self.input_shape = X.shape  # (N, C, H, W)
-        out = X
-        for layer in self.layers:
-            out = layer.forward(out)
+        if not self.training:
+            return self.predict(X)
+        out = X.astype(self.policy.compute_dtype, copy=False)
+        profiler = self.profiler
+        for i, layer in enumerate(self.exec_layers):
+            if profiler is None:
+                out = layer.forward(out)
+            else:
+                out = profiler.call(self._layer_name(i), "forward", layer.forward, out)
+        return out
+
+    def predict(self, X, batch_size=None):
+        """
+        Inference-only forward pass. Layers keep nothing for backward, and
+        large inputs are processed in chunks of batch_size into one output.
+        """
+        N = X.shape[0]
+        if batch_size is None or batch_size >= N:
+            return self._infer(X)
+
+        out = None
+        for start in range(0, N, batch_size):
+            chunk = self._infer(X[start : start + batch_size])
+            if out is None:
+                out = np.empty((N,) + chunk.shape[1:], dtype=chunk.dtype)
+            out[start : start + chunk.shape[0]] = chunk
         return out
 
+    def _infer(self, X):
+        out = X.astype(self.policy.compute_dtype, copy=False)
+        profiler = self.profiler
+        for i, layer in enumerate(self.exec_layers):
+            if profiler is None:
+                out = layer.infer(out)
+            else:
+                out = profiler.call(self._layer_name(i), "infer", layer.infer, out)
+        return out
+
+    def _layer_name(self, i):
+        return f"{i}:{type(self.exec_layers[i]).__name__}"
+
+    def enable_profiling(self, profiler=None, **kwargs):
+        """
+        Record per-layer time, allocations and output shapes for every
+        forward/backward/infer call until disable_profiling(). Returns the
+        src.profiler.LayerProfiler (kwargs go to its constructor); the
+        training loop calls its end_step() after each optimizer step.
+        """
+        if profiler is None:
+            from src.profiler import LayerProfiler
+
+            profiler = LayerProfiler(**kwargs)
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.close()
+        return profiler
+
+    @contextmanager
+    def inference(self):
+        # Within this block forward() runs the inference-only path
+        previous = self.training
+        self.training = False
+        try:
+            yield self
+        finally:
+            self.training = previous
+
     def compute_loss(self, out, y):
+        # Training uses the fused loss_layer; this scores softmax outputs
         N = y.shape[0]
         y_one_hot_vec = one_hot(y, 10)
         log_out = np.log(out + 1e-9)
         loss = -np.sum(y_one_hot_vec * log_out) / N
         return loss, y_one_hot_vec
 
+    def training_layers(self):
+        # The fused loss takes logits, so a trailing softmax layer is skipped
+        layers = self.exec_layers
+        if isinstance(layers[-1], SoftmaxLayer):
+            return layers[:-1]
+        return layers
+
+    def compile(self, input_shape):
+        """
+        Plan every activation and input gradient of a training step at
+        input_shape into one reused arena. Batches of that shape then run
+        with out= writes; other shapes still take the allocating path.
+        """
+        from src.planner import plan_memory
+
+        self.memory_plan = plan_memory(
+            self.training_layers(),
+            input_shape,
+            self.policy.compute_dtype,
+            self.policy.accum_dtype,
+        )
+        return self.memory_plan
+
     def loss_and_backward(self, X, y):
-        out = self.forward(X)
-        loss, y_one_hot_vec = self.compute_loss(out, y)
-        N = y.shape[0]
-        dOut = (out - y_one_hot_vec) / N
+        layers = self.training_layers()
+        plan = self.memory_plan
+        if plan is not None and plan.matches(X):
+            forward_out, backward_out = plan.forward_out, plan.backward_out
+        else:
+            forward_out = backward_out = [None] * len(layers)
 
-        for layer in reversed(self.layers):
-            dOut = layer.backward(dOut)
+        if not hasattr(self, "input_shape"):
+            self.input_shape = X.shape
+        out = X.astype(self.policy.compute_dtype, copy=False)
+        profiler = self.profiler
+        for i, (layer, buf) in enumerate(zip(layers, forward_out)):
+            if profiler is None:
+                out = layer.forward(out, buf)
+            else:
+                name = self._layer_name(i)
+                out = profiler.call(name, "forward", layer.forward, out, buf)
+        if layers is not self.exec_layers:
+            self.exec_layers[-1].out_dim = out.shape[1]
+
+        if profiler is None:
+            loss, dOut = self.loss_layer.forward(out, y)
+        else:
+            loss, dOut = profiler.call(
+                "loss", "forward", self.loss_layer.forward, out, y
+            )
+        # Correct predictions of this batch, from the logits already computed
+        self.last_correct = self.loss_layer.correct
+
+        for i in reversed(range(len(layers))):
+            if profiler is None:
+                dOut = layers[i].backward(dOut, backward_out[i])
+            else:
+                name = self._layer_name(i)
+                dOut = profiler.call(
+                    name, "backward", layers[i].backward, dOut, backward_out[i]
+                )
 
         return loss
 
@@ -249,7 +923,7 @@ class Network:
         a dictionary of intermediate outputs after each layer.
         """
         intermediates = {}
-        out = X
+        out = X.astype(self.policy.compute_dtype, copy=False)
 
         # input is just X
         intermediates["input"] = out
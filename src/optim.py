@@ -0,0 +1,201 @@
+import numpy as np
+
+
+def bind_parameters(net, flat_params, flat_grads=None):
+    """
+    Rebind every W/b of `net` to a view into `flat_params` (and dW/db into
+    `flat_grads`), in Network.parameters() order. Values are not copied;
+    the flat buffers are the parameters from here on.
+    """
+    offset = 0
+    for layer, name in net.parameters():
+        shape = getattr(layer, name).shape
+        size = int(np.prod(shape))
+        setattr(layer, name, flat_params[offset : offset + size].reshape(shape))
+        if flat_grads is not None:
+            # grad_buffer() keeps an existing buffer of the right shape/dtype
+            setattr(
+                layer, "d" + name, flat_grads[offset : offset + size].reshape(shape)
+            )
+        offset += size
+    return offset
+
+
+def flatten_parameters(net, dtype=None):
+    params = [getattr(layer, name) for layer, name in net.parameters()]
+    dtype = dtype or params[0].dtype
+    return np.concatenate([p.ravel() for p in params]).astype(dtype, copy=False)
+
+
+class ParameterBuffer:
+    """
+    All of a network's parameters in one contiguous vector, and all of its
+    gradients in another. Each layer's W/b and dW/db become views into
+    them, so backward writes gradients straight into `grads` and an
+    optimizer step is a few whole-vector operations.
+
+    Bind before building replicas (ShardedExecutor), which share the
+    parameter arrays they see at construction; calling set_policy() on
+    the network afterwards replaces the views and needs a new buffer.
+    """
+
+    def __init__(self, net):
+        self.net = net
+        self.params = flatten_parameters(net, net.policy.param_dtype)
+        self.grads = np.zeros(self.params.size, dtype=net.policy.accum_dtype)
+        bind_parameters(net, self.params, self.grads)
+
+    @property
+    def size(self):
+        return self.params.size
+
+
+class Optimizer:
+    """
+    Base class: updates ParameterBuffer.params in place from .grads.
+    Per-parameter state (momentum, moments) is kept as flat vectors of
+    the same length, and `scratch` is reused by every step.
+    """
+
+    def __init__(self, params, lr):
+        if not isinstance(params, ParameterBuffer):
+            params = ParameterBuffer(params)
+        self.buffer = params
+        self.lr = lr
+        self.step_count = 0
+        self.scratch = np.empty_like(params.grads)
+
+    def state_vectors(self):
+        # Flat per-parameter state, by name
+        return {}
+
+    def state_config(self):
+        # Hyperparameters that decide what the state vectors mean; a
+        # checkpoint only restores into an optimizer with the same ones
+        return {}
+
+    def step(self):
+        self.step_count += 1
+        self._update(self.buffer.params, self.buffer.grads, self.scratch)
+
+    def _update(self, params, grads, scratch):
+        raise NotImplementedError
+
+
+class SGD(Optimizer):
+    def __init__(self, params, lr=0.01, momentum=0.0, nesterov=False, weight_decay=0.0):
+        super().__init__(params, lr)
+        if nesterov and momentum <= 0:
+            raise ValueError("Nesterov momentum requires momentum > 0")
+        self.momentum = momentum
+        self.nesterov = nesterov
+        self.weight_decay = weight_decay
+        self.velocity = np.zeros_like(self.buffer.grads) if momentum else None
+
+    def state_vectors(self):
+        return {} if self.velocity is None else {"velocity": self.velocity}
+
+    def state_config(self):
+        return {"momentum": self.momentum, "nesterov": self.nesterov}
+
+    def _update(self, params, grads, scratch):
+        if self.weight_decay:
+            np.multiply(params, self.weight_decay, out=scratch)
+            grads += scratch
+
+        direction = grads
+        if self.velocity is not None:
+            v = self.velocity
+            v *= self.momentum
+            v += grads
+            if self.nesterov:
+                np.multiply(v, self.momentum, out=scratch)
+                scratch += grads
+                direction = scratch
+            else:
+                direction = v
+
+        np.multiply(direction, self.lr, out=scratch)
+        params -= scratch
+
+
+class Adam(Optimizer):
+    """
+    Adam (Kingma & Ba, 2015). weight_decay here is the classic L2 term
+    added to the gradient; AdamW decouples it.
+    """
+
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0):
+        super().__init__(params, lr)
+        self.beta1, self.beta2 = betas
+        self.eps = eps
+        self.weight_decay = weight_decay
+        self.m = np.zeros_like(self.buffer.grads)
+        self.v = np.zeros_like(self.buffer.grads)
+
+    def state_vectors(self):
+        return {"m": self.m, "v": self.v}
+
+    def state_config(self):
+        return {"betas": [self.beta1, self.beta2]}
+
+    def _decay(self, params, grads, scratch):
+        if self.weight_decay:
+            np.multiply(params, self.weight_decay, out=scratch)
+            grads += scratch
+
+    def _update(self, params, grads, scratch):
+        self._decay(params, grads, scratch)
+        b1, b2, t = self.beta1, self.beta2, self.step_count
+
+        # m = b1 * m + (1 - b1) * g;  v = b2 * v + (1 - b2) * g^2
+        self.m *= b1
+        np.multiply(grads, 1 - b1, out=scratch)
+        self.m += scratch
+        self.v *= b2
+        np.multiply(grads, grads, out=scratch)
+        scratch *= 1 - b2
+        self.v += scratch
+
+        # Bias corrections folded into one step size and a scaled epsilon
+        bias2 = np.sqrt(1 - b2**t)
+        step_size = self.lr * bias2 / (1 - b1**t)
+        np.sqrt(self.v, out=scratch)
+        scratch += self.eps * bias2
+        np.divide(self.m, scratch, out=scratch)
+        scratch *= step_size
+        params -= scratch
+
+
+class AdamW(Adam):
+    # Decoupled weight decay (Loshchilov & Hutter, 2019)
+    def __init__(
+        self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=1e-2
+    ):
+        super().__init__(params, lr, betas, eps, weight_decay)
+
+    def _decay(self, params, grads, scratch):
+        if self.weight_decay:
+            params *= 1 - self.lr * self.weight_decay
+
+
+OPTIMIZERS = {"sgd": SGD, "adam": Adam, "adamw": AdamW}
+
+
+def make_optimizer(name, params, lr, **kwargs):
+    """
+    Build an optimizer by name: "sgd", "momentum" (SGD with Nesterov
+    momentum 0.9), "adam" or "adamw". Extra keyword arguments go to the
+    optimizer's constructor.
+    """
+    name = name.lower()
+    if name == "momentum":
+        kwargs.setdefault("momentum", 0.9)
+        kwargs.setdefault("nesterov", True)
+        name = "sgd"
+    if name not in OPTIMIZERS:
+        raise ValueError(
+            f"Unknown optimizer {name!r}; expected one of "
+            f"{sorted(OPTIMIZERS) + ['momentum']}"
+        )
+    return OPTIMIZERS[name](params, lr=lr, **kwargs)
@@ -0,0 +1,109 @@
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # optional: only needed to cap BLAS threads at runtime
+    threadpool_limits = None
+
+
+def limit_blas_threads(num_threads):
+    """
+    Cap the BLAS thread pool so shard threads times BLAS threads does not
+    exceed the core count. Returns a handle with restore(), or None when
+    threadpoolctl is not installed (then set OMP_NUM_THREADS /
+    OPENBLAS_NUM_THREADS / MKL_NUM_THREADS before starting Python).
+    """
+    if threadpool_limits is None:
+        warnings.warn(
+            "threadpoolctl is not installed; BLAS thread count left unchanged",
+            RuntimeWarning,
+        )
+        return None
+    return threadpool_limits(limits=num_threads, user_api="blas")
+
+
+def shard_bounds(n, num_shards):
+    # (start, end) of num_shards near-equal contiguous shards of range(n)
+    edges = np.linspace(0, n, num_shards + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+class ShardedExecutor:
+    """
+    Runs Network.loss_and_backward with each mini-batch split into shards
+    across a thread pool. Every thread owns a replica of the network that
+    shares the parameter arrays, and shard gradients are reduced in shard
+    order into the master network's dW/db, so results do not depend on
+    thread scheduling.
+    """
+
+    def __init__(self, net, num_threads=None, blas_threads=None, min_shard_size=8):
+        cpus = os.cpu_count() or 1
+        self.net = net
+        self.num_threads = num_threads or cpus
+        self.min_shard_size = min_shard_size
+        self.replicas = [net.replicate() for _ in range(self.num_threads)]
+        self.param_layers = [
+            i for i, layer in enumerate(net.layers) if hasattr(layer, "W")
+        ]
+        self.pool = ThreadPoolExecutor(max_workers=self.num_threads)
+        self.last_correct = 0
+
+        # Without threadpoolctl the default split is skipped quietly; an
+        # explicit blas_threads request warns instead
+        self.blas_limits = None
+        if blas_threads is not None or threadpool_limits is not None:
+            if blas_threads is None:
+                blas_threads = max(1, cpus // self.num_threads)
+            self.blas_limits = limit_blas_threads(blas_threads)
+        self.blas_threads = blas_threads
+
+    def shard_bounds(self, N):
+        num_shards = max(1, min(self.num_threads, N // self.min_shard_size))
+        return shard_bounds(N, num_shards)
+
+    def compile(self, input_shape):
+        # Plan each replica's buffers for the shard shape it will always see
+        N = input_shape[0]
+        for replica, (start, end) in zip(self.replicas, self.shard_bounds(N)):
+            replica.compile((end - start,) + tuple(input_shape[1:]))
+
+    def loss_and_backward(self, X, y):
+        N = X.shape[0]
+        bounds = self.shard_bounds(N)
+        futures = [
+            self.pool.submit(replica.loss_and_backward, X[start:end], y[start:end])
+            for replica, (start, end) in zip(self.replicas, bounds)
+        ]
+        losses = [future.result() for future in futures]
+        weights = [(end - start) / N for start, end in bounds]
+        self.last_correct = sum(r.last_correct for r in self.replicas[: len(bounds)])
+
+        # Each shard's gradient is a mean over the shard; reweight to the batch
+        for i in self.param_layers:
+            layer = self.net.layers[i]
+            for name, param in (("dW", layer.W), ("db", layer.b)):
+                total = layer.grad_buffer(name, param.shape)
+                for k, weight in enumerate(weights):
+                    grad = getattr(self.replicas[k].layers[i], name)
+                    if k == 0:
+                        np.multiply(grad, weight, out=total)
+                    else:
+                        total += weight * grad
+        return float(sum(w * loss for w, loss in zip(weights, losses)))
+
+    def close(self):
+        self.pool.shutdown()
+        if self.blas_limits is not None:
+            self.blas_limits.restore_original_limits()
+            self.blas_limits = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
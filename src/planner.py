@@ -0,0 +1,157 @@
+import numpy as np
+
+
+class PlannedBuffer:
+    def __init__(self, name, shape, dtype, start):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        # Live from the step that writes it to the last step that reads it
+        self.start = start
+        self.end = start
+        self.offset = None
+
+    def overlaps(self, other):
+        return self.start <= other.end and other.start <= self.end
+
+
+class MemoryPlan:
+    """
+    Static buffer assignment for one training step at a fixed input shape.
+
+    Every layer output and input gradient written with out= gets a slot in
+    a single byte arena; slots whose lifetimes do not overlap share memory.
+    forward_out[i] / backward_out[i] are flat arrays handed to layer i, or
+    None where the layer returns a view or allocates for itself.
+    """
+
+    def __init__(self, input_shape, buffers, forward_owner, backward_owner, unplanned):
+        self.input_shape = tuple(input_shape)
+        self.buffers = buffers
+        self.unplanned = unplanned
+        self.peak_bytes = max((b.offset + b.nbytes for b in buffers), default=0)
+        self.naive_bytes = sum(b.nbytes for b in buffers) + sum(
+            nbytes for _, nbytes in unplanned
+        )
+        self.arena = np.empty(self.peak_bytes, dtype=np.uint8)
+
+        views = {}
+        for buf in buffers:
+            size = buf.nbytes // buf.dtype.itemsize
+            views[id(buf)] = np.ndarray(
+                (size,), dtype=buf.dtype, buffer=self.arena, offset=buf.offset
+            )
+        self.forward_out = [
+            self._own(b, i, forward_owner, views) for i, b in enumerate(forward_owner)
+        ]
+        self.backward_out = [
+            self._own(b, i, backward_owner, views) for i, b in enumerate(backward_owner)
+        ]
+
+    @staticmethod
+    def _own(buf, i, owners, views):
+        # Only the layer that created a buffer writes into it; views alias it
+        if buf is None or buf.name.split(":")[0] != str(i):
+            return None
+        return views[id(buf)]
+
+    def matches(self, X):
+        return X.shape == self.input_shape
+
+    def report(self):
+        lines = [f"Memory plan for input {self.input_shape}:"]
+        for buf in sorted(self.buffers, key=lambda b: b.offset):
+            lines.append(
+                f"  {buf.name:<28} {str(buf.shape):<18} {buf.nbytes / 1024:9.1f} KiB"
+                f"  offset {buf.offset:>9}  steps {buf.start}-{buf.end}"
+            )
+        for name, nbytes in self.unplanned:
+            lines.append(f"  {name:<28} {'(layer-owned)':<18} {nbytes / 1024:9.1f} KiB")
+        lines.append(self.summary())
+        return "\n".join(lines)
+
+    def summary(self):
+        planned = self.peak_bytes + sum(nbytes for _, nbytes in self.unplanned)
+        return (
+            f"Naive: {self.naive_bytes / 1024:.1f} KiB, planned: {planned / 1024:.1f} KiB "
+            f"(arena {self.peak_bytes / 1024:.1f} KiB)"
+        )
+
+
+def place_buffers(buffers, alignment=64):
+    # Greedy best-fit by size: lowest aligned offset free for the whole lifetime
+    placed = []
+    for buf in sorted(buffers, key=lambda b: b.nbytes, reverse=True):
+        busy = sorted(
+            (other.offset, other.offset + other.nbytes)
+            for other in placed
+            if other.overlaps(buf)
+        )
+        offset = 0
+        for lo, hi in busy:
+            if offset + buf.nbytes <= lo:
+                break
+            offset = max(offset, -(-hi // alignment) * alignment)
+        buf.offset = offset
+        placed.append(buf)
+    return buffers
+
+
+def plan_memory(layers, input_shape, compute_dtype, accum_dtype):
+    """
+    Plan activation and gradient buffers for forward, loss and backward
+    over `layers`. Steps are numbered forward 0..L-1, loss L and backward
+    of layer i at 2L - i. Layers describe themselves with output_shape()
+    and the forward_out / backward_out / output_is_view / saves_input
+    attributes.
+    """
+    L = len(layers)
+    shapes = [tuple(input_shape)]
+    for layer in layers:
+        shapes.append(tuple(layer.output_shape(shapes[-1])))
+
+    buffers = []
+    unplanned = []
+
+    def new_buffer(i, direction, shape, dtype, start):
+        name = f"{i}:{type(layers[i]).__name__}.{direction}"
+        buf = PlannedBuffer(name, shape, dtype, start)
+        buffers.append(buf)
+        return buf
+
+    # Forward activations: output i is read by layer i + 1 (or the loss),
+    # and kept until layer i + 1's backward if that layer saves its input
+    forward_owner = [None] * L
+    for i, layer in enumerate(layers):
+        if layer.output_is_view:
+            forward_owner[i] = forward_owner[i - 1] if i > 0 else None
+        elif layer.forward_out:
+            forward_owner[i] = new_buffer(i, "forward", shapes[i + 1], compute_dtype, i)
+        else:
+            nbytes = int(np.prod(shapes[i + 1])) * np.dtype(compute_dtype).itemsize
+            unplanned.append((f"{i}:{type(layer).__name__}.forward", nbytes))
+    for i in range(L):
+        end = i + 1
+        if i + 1 < L and layers[i + 1].saves_input:
+            end = 2 * L - (i + 1)
+        if forward_owner[i] is not None:
+            forward_owner[i].end = max(forward_owner[i].end, end)
+
+    # Input gradients: dX of layer i is read by layer i - 1's backward
+    backward_owner = [None] * L
+    for i in reversed(range(L)):
+        step = 2 * L - i
+        layer = layers[i]
+        if layer.output_is_view:
+            backward_owner[i] = backward_owner[i + 1] if i + 1 < L else None
+        elif layer.backward_out:
+            backward_owner[i] = new_buffer(i, "backward", shapes[i], accum_dtype, step)
+        else:
+            nbytes = int(np.prod(shapes[i])) * np.dtype(accum_dtype).itemsize
+            unplanned.append((f"{i}:{type(layer).__name__}.backward", nbytes))
+        if i > 0 and backward_owner[i] is not None:
+            backward_owner[i].end = max(backward_owner[i].end, step + 1)
+
+    place_buffers(buffers)
+    return MemoryPlan(input_shape, buffers, forward_owner, backward_owner, unplanned)
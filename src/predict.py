@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.data import (
+    GZIP_CHUNK,
+    normalize_into,
+    open_idx,
+    read_image_header,
+    uncompressed,
+)
+
+IDX_HEADER_BYTES = 16
+NUM_CLASSES = 10
+
+
+def _decode_idx_chunk(path, start, count, rows, cols):
+    # Runs in a worker process: read and normalise one slice of an IDX3 file
+    offset = IDX_HEADER_BYTES + start * rows * cols
+    pixels = np.fromfile(path, dtype=np.uint8, count=count * rows * cols, offset=offset)
+    images = np.empty((count, 1, rows, cols), dtype=np.float32)
+    return normalize_into(pixels.reshape(images.shape), images)
+
+
+def _decode_png_chunk(paths, size=(28, 28)):
+    # Runs in a worker process; Pillow is only needed for image directories
+    from PIL import Image
+
+    pixels = np.empty((len(paths), 1) + size, dtype=np.uint8)
+    for i, path in enumerate(paths):
+        with Image.open(path) as img:
+            img = img.convert("L")
+            if img.size != size:
+                img = img.resize(size, Image.BILINEAR)
+            pixels[i, 0] = np.asarray(img, dtype=np.uint8)
+    return normalize_into(pixels, np.empty(pixels.shape, dtype=np.float32))
+
+
+class IdxSource:
+    def __init__(self, path):
+        # Workers read slices at byte offsets, so a .gz is read through an
+        # existing sidecar or decompressed to a temporary file, never
+        # written next to the input
+        self.tmp_path = None
+        plain = uncompressed(path)
+        if plain is None:
+            fd, plain = tempfile.mkstemp(suffix=".idx3-ubyte")
+            self.tmp_path = plain
+            try:
+                with os.fdopen(fd, "wb") as out, open_idx(path) as f:
+                    shutil.copyfileobj(f, out, GZIP_CHUNK)
+            except BaseException:
+                self.close()
+                raise
+        self.path = plain
+        with open(plain, "rb") as f:
+            self.count, self.rows, self.cols = read_image_header(f)
+        self.names = None
+
+    def close(self):
+        if self.tmp_path is not None:
+            os.remove(self.tmp_path)
+            self.tmp_path = None
+
+    def chunks(self, chunk_size):
+        for start in range(0, self.count, chunk_size):
+            count = min(chunk_size, self.count - start)
+            yield _decode_idx_chunk, (self.path, start, count, self.rows, self.cols)
+
+
+class PngDirectorySource:
+    def __init__(self, path):
+        self.names = sorted(n for n in os.listdir(path) if n.lower().endswith(".png"))
+        self.paths = [os.path.join(path, n) for n in self.names]
+        self.count = len(self.paths)
+
+    def close(self):
+        pass
+
+    def chunks(self, chunk_size):
+        for start in range(0, self.count, chunk_size):
+            yield _decode_png_chunk, (self.paths[start : start + chunk_size],)
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        return PngDirectorySource(path)
+    return IdxSource(path)
+
+
+class NpyWriter:
+    """
+    Predictions and probabilities as one structured .npy array, written
+    through a memory map so each chunk goes to disk as it is produced.
+    """
+
+    dtype = np.dtype([("prediction", np.uint8), ("probs", np.float32, NUM_CLASSES)])
+
+    def __init__(self, path, count, names=None):
+        self.out = np.lib.format.open_memmap(
+            path, mode="w+", dtype=self.dtype, shape=(count,)
+        )
+
+    def write(self, start, preds, probs):
+        block = self.out[start : start + len(preds)]
+        block["prediction"] = preds
+        block["probs"] = probs
+
+    def close(self):
+        self.out.flush()
+        self.out = None
+
+
+class CsvWriter:
+    def __init__(self, path, count, names=None):
+        self.f = open(path, "w")
+        self.names = names
+        probs = ",".join(f"p{c}" for c in range(NUM_CLASSES))
+        self.f.write(f"{'file' if names else 'index'},prediction,{probs}\n")
+
+    def write(self, start, preds, probs):
+        keys = self.names[start : start + len(preds)] if self.names else None
+        lines = []
+        for i, (pred, row) in enumerate(zip(preds, probs)):
+            key = keys[i] if keys else start + i
+            lines.append(f"{key},{pred}," + ",".join(f"{p:.6f}" for p in row))
+        self.f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+def predict_stream(net, source_path, output_path, chunk_size=1024, workers=None):
+    """
+    Score every image of an IDX3 file or a directory of PNGs and write
+    predictions incrementally to output_path (.npy or .csv). Chunks are
+    decoded in a process pool, at most 2 * workers ahead of inference,
+    so memory stays bounded by the chunk size rather than the input.
+    Returns images/sec.
+    """
+    source = open_source(source_path)
+    writer_cls = CsvWriter if output_path.endswith(".csv") else NpyWriter
+    writer = writer_cls(output_path, source.count, source.names)
+    workers = workers or os.cpu_count() or 1
+
+    start_time = time.perf_counter()
+    done = 0
+    pending = deque()
+    chunks = iter(source.chunks(chunk_size))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+
+            def refill():
+                while len(pending) < 2 * workers:
+                    job = next(chunks, None)
+                    if job is None:
+                        return
+                    decode, args = job
+                    pending.append(pool.submit(decode, *args))
+
+            refill()
+            while pending:
+                images = pending.popleft().result()
+                refill()  # keep the pool decoding while this chunk runs
+                probs = net.predict(images)
+                writer.write(done, probs.argmax(axis=1), probs)
+                done += len(images)
+                elapsed = time.perf_counter() - start_time
+                print(
+                    f"\r{done}/{source.count} images, {done / elapsed:.0f} images/s",
+                    end="",
+                    flush=True,
+                )
+    finally:
+        writer.close()
+        source.close()
+
+    rate = done / (time.perf_counter() - start_time)
+    print(f"\nWrote {done} predictions to {output_path} ({rate:.0f} images/s)")
+    return rate
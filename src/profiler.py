@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+import numpy as np
+
+from src.fileutil import atomic_write
+
+
+class LayerProfiler:
+    """
+    Opt-in per-layer instrumentation for Network (see
+    Network.enable_profiling). Every layer call records wall time, bytes
+    allocated while it ran and its output shape; the last `window` calls
+    are kept per (layer, direction) for rolling averages. The training
+    loop calls end_step() once per optimizer step, however many replicas
+    ran it; inference calls are recorded but never advance the step.
+
+    Bytes come from tracemalloc, which NumPy reports its allocations to.
+    Its peak counter is process-wide, so with several threads running
+    layers at once the byte counts of overlapping calls blur together;
+    with track_memory=False tracemalloc stays off and the output's size
+    is recorded instead.
+    """
+
+    def __init__(self, window=100, track_memory=True):
+        self.window = window
+        self.track_memory = track_memory
+        self.lock = threading.Lock()
+        self.reset()
+        self.trace_events = None
+        self.trace_steps_left = 0
+        self.trace_path = None
+        # Only stopped again by close() if this profiler was the one to start it
+        self.started_tracemalloc = track_memory and not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+
+    def reset(self):
+        self.history = defaultdict(lambda: deque(maxlen=self.window))
+        self.shapes = {}
+        self.order = []
+        self.steps = 0
+
+    def call(self, name, direction, fn, *args):
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter_ns()
+        out = fn(*args)
+        elapsed = time.perf_counter_ns() - start
+
+        # The loss returns (loss, grad); its shape is the gradient's
+        result = out[1] if isinstance(out, tuple) else out
+        shape = tuple(getattr(result, "shape", ()))
+        if self.track_memory:
+            allocated = tracemalloc.get_traced_memory()[1] - before
+        else:
+            allocated = getattr(result, "nbytes", 0)
+        self.record(name, direction, start, elapsed, allocated, shape)
+        return out
+
+    def record(self, name, direction, start_ns, elapsed_ns, allocated, shape):
+        key = (name, direction)
+        with self.lock:
+            if key not in self.shapes:
+                self.order.append(key)
+            self.history[key].append((elapsed_ns, allocated))
+            self.shapes[key] = shape
+            if self.trace_events is not None:
+                self.trace_events.append(
+                    {
+                        "name": name,
+                        "cat": direction,
+                        "ph": "X",
+                        "ts": start_ns / 1e3,
+                        "dur": elapsed_ns / 1e3,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "args": {"bytes": allocated, "shape": list(shape)},
+                    }
+                )
+
+    def end_step(self):
+        finished = None
+        with self.lock:
+            self.steps += 1
+            if self.trace_events is not None:
+                self.trace_steps_left -= 1
+                if self.trace_steps_left <= 0:
+                    finished = self.trace_events
+                    self.trace_events = None
+        if finished is not None:
+            self._write_trace(finished, self.trace_path)
+
+    def start_trace(self, path, num_steps=20):
+        # Record every call of the next num_steps optimizer steps, then write them
+        # to path in Chrome trace format (chrome://tracing, Perfetto)
+        with self.lock:
+            self.trace_events = []
+            self.trace_steps_left = num_steps
+            self.trace_path = path
+
+    @staticmethod
+    def _write_trace(events, path):
+        with atomic_write(path) as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Wrote Chrome trace of {len(events)} layer calls to {path}")
+
+    def stats(self):
+        """
+        One row per (layer, direction) in first-seen order: mean time in
+        ms, mean bytes allocated, last output shape and share of the total.
+        """
+        with self.lock:
+            rows = []
+            for key in self.order:
+                samples = np.array(self.history[key], dtype=np.float64)
+                rows.append(
+                    {
+                        "layer": key[0],
+                        "direction": key[1],
+                        "ms": samples[:, 0].mean() / 1e6,
+                        "bytes": samples[:, 1].mean(),
+                        "shape": self.shapes[key],
+                    }
+                )
+        total = sum(r["ms"] for r in rows) or 1.0
+        for r in rows:
+            r["share"] = r["ms"] / total
+        return rows
+
+    def summary(self, top=None):
+        rows = self.stats()
+        if top is not None:
+            rows = sorted(rows, key=lambda r: r["ms"], reverse=True)[:top]
+        lines = [
+            f"{'layer':<24} {'dir':<8} {'ms':>8} {'share':>6} {'alloc KiB':>10}  shape"
+        ]
+        for r in rows:
+            lines.append(
+                f"{r['layer']:<24} {r['direction']:<8} {r['ms']:>8.3f} "
+                f"{r['share'] * 100:>5.1f}% {r['bytes'] / 1024:>10.1f}  {r['shape']}"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        if self.started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.started_tracemalloc = False
@@ -0,0 +1,517 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.network import (
+    ConvLayer,
+    ConvReLUPoolLayer,
+    FlattenLayer,
+    FullyConnectedLayer,
+    MaxPoolLayer,
+    ReLULayer,
+    SoftmaxLayer,
+    im2col,
+)
+
+QMAX = 127
+# float32 represents every integer below 2**24 exactly, so a float32 GEMM
+# over int8-valued operands is exact for K up to EXACT_K
+EXACT_LIMIT = 1 << 24
+EXACT_K = EXACT_LIMIT // (QMAX * QMAX)
+
+
+def quantize_symmetric(X, scale, out=None):
+    # Round to the nearest step and saturate; int8-valued, in X's float dtype
+    out = np.divide(X, scale, out=out)
+    np.rint(out, out=out)
+    return np.clip(out, -QMAX, QMAX, out=out)
+
+
+def quantize_per_channel(W, axis):
+    """
+    Symmetric int8 weights with one scale per output channel (`axis`).
+    Returns (int8 weights, float32 scales).
+    """
+    reduce_axes = tuple(a for a in range(W.ndim) if a != axis)
+    amax = np.abs(W).max(axis=reduce_axes, keepdims=True)
+    scale = np.where(amax > 0, amax / QMAX, 1.0).astype(np.float32)
+    W_q = np.clip(np.rint(W / scale), -QMAX, QMAX).astype(np.int8)
+    return W_q, scale.reshape(-1)
+
+
+def int_gemm(A, B, bias=None):
+    """
+    int32 A @ B (+ bias) for int8-valued operands. The products run through
+    float32 BLAS, split along K so every partial sum is exactly
+    representable, and the partials are accumulated in int32, so the
+    values are bit-identical to an int32 GEMM without NumPy's much slower
+    integer matmul. When the whole sum is provably below 2**24 the result
+    stays in float32, which holds those integers exactly.
+    """
+    A = A.astype(np.float32, copy=False)
+    B = B.astype(np.float32, copy=False)
+    K = A.shape[1]
+    bias_max = 0 if bias is None else int(np.abs(bias).max())
+    if K * QMAX * QMAX + bias_max < EXACT_LIMIT:
+        acc = np.dot(A, B)
+        if bias is not None:
+            acc += bias.astype(np.float32)
+        return acc
+
+    acc = np.dot(A[:, :EXACT_K], B[:EXACT_K]).astype(np.int32)
+    for start in range(EXACT_K, K, EXACT_K):
+        acc += np.dot(A[:, start : start + EXACT_K], B[start : start + EXACT_K]).astype(
+            np.int32
+        )
+    if bias is not None:
+        acc += bias
+    return acc
+
+
+def quantize_input(X, scale, in_scale):
+    """
+    int8 values at in_scale for a layer input: float inputs (scale None)
+    are quantized, and int8 values produced at a different scale are
+    requantized rather than misread.
+    """
+    if scale is None:
+        return quantize_symmetric(X, in_scale, np.empty(X.shape, np.float32))
+    if scale == in_scale:
+        return X
+    return quantize_symmetric(X.astype(np.float32) * scale, in_scale)
+
+
+class QuantizedConvLayer:
+    """
+    int8 convolution: the input is quantized with a calibrated per-tensor
+    scale, im2col + integer GEMM accumulate in int32 with the bias folded
+    in, and the result is requantized to int8 with the output scale.
+
+    For a fused Conv -> ReLU -> MaxPool block the pooling and ReLU run on
+    the accumulator before requantization (both commute with the positive
+    per-channel multiplier), so only the pooled quarter is requantized.
+    """
+
+    quantized = True
+
+    def __init__(self, conv, in_scale, out_scale, pool_size=None, relu=False):
+        self.kernel_size = conv.kernel_size
+        self.stride = conv.stride
+        self.padding = conv.padding
+        self.pool_size = pool_size
+        self.relu = relu
+        self.in_scale = float(in_scale)
+        self.out_scale = float(out_scale)
+        self.W_q, self.w_scale = quantize_per_channel(conv.W, axis=0)
+        acc_scale = self.in_scale * self.w_scale
+        self.b_q = np.rint(conv.b / acc_scale).astype(np.int32)
+        # Per-channel multiplier from the int32 accumulator to the int8 output
+        self.requant = (acc_scale / self.out_scale).astype(np.float32)
+
+    def infer(self, X, scale):
+        N, C, H, W = X.shape
+        K = self.W_q.shape[0]
+        X = quantize_input(X, scale, self.in_scale)
+        col = im2col(X, self.kernel_size, self.stride, self.padding)
+        acc = int_gemm(col, self.W_q.reshape(K, -1).T, self.b_q)
+
+        H_out = (H + 2 * self.padding - self.kernel_size) // self.stride + 1
+        W_out = (W + 2 * self.padding - self.kernel_size) // self.stride + 1
+        acc = acc.reshape(N, H_out, W_out, K)
+        if self.pool_size:
+            p = self.pool_size
+            HH, WW = H_out // p, W_out // p
+            views = [
+                acc[:, dy : dy + HH * p : p, dx : dx + WW * p : p, :]
+                for dy in range(p)
+                for dx in range(p)
+            ]
+            acc = views[0].copy()
+            for view in views[1:]:
+                np.maximum(acc, view, out=acc)
+        if self.relu:
+            np.maximum(acc, 0, out=acc)
+
+        requantized = acc.astype(np.float32, copy=False)
+        requantized *= self.requant
+        quantize_symmetric(requantized, 1.0, requantized)
+        # Stored NCHW-contiguous so a following Flatten is a view
+        N, HH, WW, _ = requantized.shape
+        out = np.empty((N, K, HH, WW), dtype=np.int8)
+        np.copyto(out.transpose(0, 2, 3, 1), requantized, casting="unsafe")
+        return out, self.out_scale
+
+    def state(self):
+        return {
+            "W_q": self.W_q,
+            "w_scale": self.w_scale,
+            "b_q": self.b_q,
+            "requant": self.requant,
+            "in_scale": np.float64(self.in_scale),
+            "out_scale": np.float64(self.out_scale),
+            "kernel_size": np.int64(self.kernel_size),
+            "stride": np.int64(self.stride),
+            "padding": np.int64(self.padding),
+            "pool_size": np.int64(self.pool_size or 0),
+            "relu": np.bool_(self.relu),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        layer = cls.__new__(cls)
+        for name in ("W_q", "w_scale", "b_q", "requant"):
+            setattr(layer, name, state[name])
+        layer.in_scale = float(state["in_scale"])
+        layer.out_scale = float(state["out_scale"])
+        layer.kernel_size = int(state["kernel_size"])
+        layer.stride = int(state["stride"])
+        layer.padding = int(state["padding"])
+        layer.pool_size = int(state["pool_size"]) or None
+        layer.relu = bool(state["relu"])
+        return layer
+
+
+class QuantizedFullyConnectedLayer:
+    # int8 x int8 -> int32, dequantized to float logits
+    quantized = True
+
+    def __init__(self, fc, in_scale):
+        self.in_scale = float(in_scale)
+        self.W_q, self.w_scale = quantize_per_channel(fc.W, axis=1)
+        self.acc_scale = (self.in_scale * self.w_scale).astype(np.float32)
+        self.b_q = np.rint(fc.b / self.acc_scale).astype(np.int32)
+
+    def infer(self, X, scale):
+        X = quantize_input(X, scale, self.in_scale)
+        acc = int_gemm(X, self.W_q, self.b_q)
+        out = acc.astype(np.float32)
+        out *= self.acc_scale
+        return out, None
+
+    def state(self):
+        return {
+            "W_q": self.W_q,
+            "w_scale": self.w_scale,
+            "b_q": self.b_q,
+            "acc_scale": self.acc_scale,
+            "in_scale": np.float64(self.in_scale),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        layer = cls.__new__(cls)
+        for name in ("W_q", "w_scale", "b_q", "acc_scale"):
+            setattr(layer, name, state[name])
+        layer.in_scale = float(state["in_scale"])
+        return layer
+
+
+class FloatLayer:
+    """
+    A float layer inside the quantized network (pooling, softmax, or a
+    layer that fell back). int8 inputs are dequantized first, except for
+    layers that commute with a positive scale (ReLU, max pool, flatten),
+    which run on the int8 values directly.
+    """
+
+    quantized = False
+    SCALE_INVARIANT = (ReLULayer, MaxPoolLayer, FlattenLayer)
+
+    def __init__(self, layer):
+        self.layer = layer
+
+    def infer(self, X, scale):
+        if scale is not None and isinstance(self.layer, self.SCALE_INVARIANT):
+            return self.layer.infer(X), scale
+        if scale is not None:
+            X = X.astype(np.float32) * scale
+        return self.layer.infer(X), None
+
+    def state(self):
+        # Enough to rebuild the layer: its class, weights and geometry
+        layer = self.layer
+        state = {"type": np.str_(type(layer).__name__)}
+        if isinstance(layer, ConvReLUPoolLayer):
+            state["pool_size"] = np.int64(layer.pool.pool_size)
+            state["pool_stride"] = np.int64(layer.pool.stride)
+            layer = layer.conv
+        if isinstance(layer, MaxPoolLayer):
+            state["pool_size"] = np.int64(layer.pool_size)
+            state["pool_stride"] = np.int64(layer.stride)
+        if isinstance(layer, ConvLayer):
+            state["stride"] = np.int64(layer.stride)
+            state["padding"] = np.int64(layer.padding)
+        for name in ("W", "b"):
+            if hasattr(layer, name):
+                state[name] = getattr(layer, name)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        kind = str(state["type"])
+        if kind in ("ConvLayer", "ConvReLUPoolLayer"):
+            out_channels, in_channels, kernel_size, _ = state["W"].shape
+            layer = ConvLayer(
+                in_channels,
+                out_channels,
+                kernel_size,
+                int(state["stride"]),
+                int(state["padding"]),
+            )
+        elif kind == "FullyConnectedLayer":
+            layer = FullyConnectedLayer(*state["W"].shape)
+        elif kind == "MaxPoolLayer":
+            layer = MaxPoolLayer(int(state["pool_size"]), int(state["pool_stride"]))
+        elif kind in FLOAT_LAYERS:
+            layer = FLOAT_LAYERS[kind]()
+        else:
+            raise ValueError(f"Unknown float layer {kind!r} in quantized model")
+        for name in ("W", "b"):
+            if name in state:
+                setattr(layer, name, state[name])
+        if kind == "ConvReLUPoolLayer":
+            pool = MaxPoolLayer(int(state["pool_size"]), int(state["pool_stride"]))
+            layer = ConvReLUPoolLayer(layer, ReLULayer(), pool)
+        return cls(layer)
+
+
+FLOAT_LAYERS = {
+    "ReLULayer": ReLULayer,
+    "FlattenLayer": FlattenLayer,
+    "SoftmaxLayer": SoftmaxLayer,
+}
+LAYER_KINDS = {
+    "int8_conv": QuantizedConvLayer,
+    "int8_fc": QuantizedFullyConnectedLayer,
+    "float": FloatLayer,
+}
+
+
+class QuantizedNetwork:
+    """
+    Post-training int8 version of a trained Network. Built by quantize(),
+    it exposes the same predict() as Network and reports which layers
+    were quantized and how far each strays from the float model.
+    save() writes every layer's weights, scales and geometry (float
+    fallbacks included) to one .npz, and load() rebuilds the network from
+    it alone.
+    """
+
+    def __init__(self, layers, report):
+        self.layers = layers
+        self.report = report
+
+    def predict(self, X, batch_size=None):
+        N = X.shape[0]
+        if batch_size is None or batch_size >= N:
+            return self._infer(X)
+        return np.concatenate(
+            [self._infer(X[s : s + batch_size]) for s in range(0, N, batch_size)]
+        )
+
+    def _infer(self, X):
+        out, scale = X.astype(np.float32, copy=False), None
+        for layer in self.layers:
+            out, scale = layer.infer(out, scale)
+        if scale is not None:
+            out = out.astype(np.float32) * scale
+        return out
+
+    def save(self, path):
+        kinds = {cls: kind for kind, cls in LAYER_KINDS.items()}
+        arrays = {
+            "kinds": np.array([kinds[type(layer)] for layer in self.layers]),
+            "report_names": np.array([name for name, _, _ in self.report]),
+            "report_status": np.array([status for _, status, _ in self.report]),
+            "report_error": np.array(
+                [np.nan if error is None else error for _, _, error in self.report]
+            ),
+        }
+        for i, layer in enumerate(self.layers):
+            for name, arr in layer.state().items():
+                arrays[f"{i}.{name}"] = arr
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            layers = []
+            for i, kind in enumerate(data["kinds"]):
+                prefix = f"{i}."
+                state = {
+                    key[len(prefix) :]: data[key]
+                    for key in data.files
+                    if key.startswith(prefix)
+                }
+                layers.append(LAYER_KINDS[str(kind)].from_state(state))
+            report = [
+                (str(name), str(status), None if np.isnan(error) else float(error))
+                for name, status, error in zip(
+                    data["report_names"], data["report_status"], data["report_error"]
+                )
+            ]
+        return cls(layers, report)
+
+    def summary(self):
+        lines = ["Quantization:"]
+        for name, status, error in self.report:
+            detail = "" if error is None else f"  relative error {error:.4f}"
+            lines.append(f"  {name:<22} {status:<8}{detail}")
+        return "\n".join(lines)
+
+
+def _relative_error(approx, exact):
+    return float(np.linalg.norm(approx - exact) / (np.linalg.norm(exact) + 1e-12))
+
+
+def quantize(net, X_calib, max_error=0.05, batch_size=256):
+    """
+    Quantize net's conv and fully connected layers to int8, calibrating
+    activation scales on X_calib. A layer fed int8 values takes its
+    producer's output scale as its input scale, so activations are never
+    rescaled between layers. Each layer is checked on the chained
+    quantized path: if its output on the calibration set is more than
+    max_error (relative) from the float network's, it stays in float.
+    """
+    activations = [X_calib.astype(np.float32)]
+    for layer in net.exec_layers:
+        activations.append(
+            np.concatenate(
+                [
+                    layer.infer(activations[-1][s : s + batch_size])
+                    for s in range(0, len(X_calib), batch_size)
+                ]
+            )
+        )
+
+    # The quantized network's own activations on the calibration set
+    X_in, scale = activations[0], None
+    layers, report = [], []
+    for i, layer in enumerate(net.exec_layers):
+        name = f"{i}:{type(layer).__name__}"
+        exact = activations[i + 1]
+        if scale is not None:
+            in_scale = scale
+        else:
+            in_scale = max(float(np.abs(X_in).max()), 1e-8) / QMAX
+        out_scale = max(float(np.abs(exact).max()), 1e-8) / QMAX
+        if isinstance(layer, ConvLayer):
+            candidate = QuantizedConvLayer(layer, in_scale, out_scale)
+        elif isinstance(layer, ConvReLUPoolLayer):
+            candidate = QuantizedConvLayer(
+                layer.conv, in_scale, out_scale, layer.pool.pool_size, relu=True
+            )
+        elif isinstance(layer, FullyConnectedLayer):
+            candidate = QuantizedFullyConnectedLayer(layer, in_scale)
+        else:
+            candidate = None
+
+        if candidate is not None:
+            out, out_scale = candidate.infer(X_in, scale)
+            approx = out if out_scale is None else out.astype(np.float32) * out_scale
+            error = _relative_error(approx, exact)
+            if error <= max_error:
+                layers.append(candidate)
+                report.append((name, "int8", error))
+                X_in, scale = out, out_scale
+                continue
+            report.append((name, "fallback", error))
+        else:
+            report.append((name, "float", None))
+        layers.append(FloatLayer(layer))
+        X_in, scale = layers[-1].infer(X_in, scale)
+    return QuantizedNetwork(layers, report)
+
+
+def _accuracy(model, X, y, batch_size):
+    return float(np.mean(model.predict(X, batch_size).argmax(axis=1) == y))
+
+
+def _throughput(model, X, batch_size, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(X, batch_size)
+        best = min(best, time.perf_counter() - start)
+    return len(X) / best
+
+
+def compare(net, qnet, X_test, y_test, batch_size=256):
+    """
+    Print accuracy, model file size and inference throughput of the
+    float network against its quantized version.
+    """
+    float_acc = _accuracy(net, X_test, y_test, batch_size)
+    quant_acc = _accuracy(qnet, X_test, y_test, batch_size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.npz")
+        quant_path = os.path.join(tmp, "int8.npz")
+        with open(float_path, "wb") as f:
+            np.savez(f, *[getattr(layer, n) for layer, n in net.parameters()])
+        qnet.save(quant_path)
+        float_size = os.path.getsize(float_path)
+        quant_size = os.path.getsize(quant_path)
+
+    float_rate = _throughput(net, X_test, batch_size)
+    quant_rate = _throughput(qnet, X_test, batch_size)
+
+    print(qnet.summary())
+    print(
+        f"Accuracy:   float {float_acc * 100:.2f}%, int8 {quant_acc * 100:.2f}% "
+        f"(delta {(quant_acc - float_acc) * 100:+.2f} points)"
+    )
+    print(
+        f"Model size: float {float_size / 1024:.1f} KiB, int8 "
+        f"{quant_size / 1024:.1f} KiB ({float_size / quant_size:.2f}x smaller)"
+    )
+    print(
+        f"Throughput: float {float_rate:.0f} images/s, int8 {quant_rate:.0f} "
+        f"images/s ({quant_rate / float_rate:.2f}x)"
+    )
+    return {
+        "float_accuracy": float_acc,
+        "int8_accuracy": quant_acc,
+        "float_bytes": float_size,
+        "int8_bytes": quant_size,
+        "float_images_per_sec": float_rate,
+        "int8_images_per_sec": quant_rate,
+    }
+
+
+def main(argv=None):
+    from src.checkpoint import Checkpointer
+    from src.data import load_mnist_data
+    from src.network import Network
+
+    parser = argparse.ArgumentParser(description="Int8 post-training quantization")
+    parser.add_argument("--checkpoint", default="checkpoints")
+    parser.add_argument("--calibration", type=int, default=1000)
+    parser.add_argument("--max-error", type=float, default=0.05)
+    parser.add_argument("--output", default="model_int8.npz")
+    args = parser.parse_args(argv)
+
+    X_train, y_train, X_test, y_test = load_mnist_data()
+    net = Network()
+    if Checkpointer(args.checkpoint).load_parameters(net) is None:
+        raise SystemExit(f"No checkpoint found in {args.checkpoint}; train first")
+
+    calib = np.random.RandomState(0).choice(
+        len(X_train), args.calibration, replace=False
+    )
+    qnet = quantize(net, X_train[calib], args.max_error)
+    compare(net, qnet, X_test, y_test)
+    qnet.save(args.output)
+    # The saved file alone must reproduce the quantized logits exactly
+    reloaded = QuantizedNetwork.load(args.output)
+    if not np.array_equal(reloaded.predict(X_test, 256), qnet.predict(X_test, 256)):
+        raise SystemExit(f"Reloading {args.output} changed the logits")
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Frozen loop-based reference backend: the layers as originally written in
+src/network.py, before any vectorization, in float64 throughout. The
+differential harness (benchmarks/differential.py) checks the fast kernels
+against these, so this file must stay slow and obvious; do not optimize it.
+"""
+
+import numpy as np
+
+
+def one_hot(labels, num_classes=10):
+    N = labels.shape[0]
+    one_hot_labels = np.zeros((N, num_classes))
+    one_hot_labels[np.arange(N), labels] = 1.0
+    return one_hot_labels
+
+
+def im2col(X, kernel_size, stride, padding):
+    N, C, H, W = X.shape
+    KH, KW = kernel_size, kernel_size
+    H_out = (H + 2 * padding - KH) // stride + 1
+    W_out = (W + 2 * padding - KW) // stride + 1
+
+    X_padded = np.pad(
+        X, ((0, 0), (0, 0), (padding, padding), (padding, padding)), mode="constant"
+    )
+    col = np.zeros((N, C, KH, KW, H_out, W_out))
+
+    for y in range(KH):
+        y_max = y + stride * H_out
+        for x in range(KW):
+            x_max = x + stride * W_out
+            col[:, :, y, x, :, :] = X_padded[:, :, y:y_max:stride, x:x_max:stride]
+
+    # (N, C, KH, KW, H_out, W_out) -> (N * H_out * W_out, C * KH * KW)
+    col = col.transpose(0, 4, 5, 1, 2, 3).reshape(N * H_out * W_out, -1)
+    return col
+
+
+def col2im(col, X_shape, kernel_size, stride, padding):
+    N, C, H, W = X_shape
+    KH, KW = kernel_size, kernel_size
+    H_out = (H + 2 * padding - KH) // stride + 1
+    W_out = (W + 2 * padding - KW) // stride + 1
+
+    col = col.reshape(N, H_out, W_out, C, KH, KW).transpose(0, 3, 4, 5, 1, 2)
+    X_padded = np.zeros((N, C, H + 2 * padding, W + 2 * padding))
+
+    for y in range(KH):
+        y_max = y + stride * H_out
+        for x in range(KW):
+            x_max = x + stride * W_out
+            X_padded[:, :, y:y_max:stride, x:x_max:stride] += col[:, :, y, x, :, :]
+
+    if padding > 0:
+        return X_padded[:, :, padding:-padding, padding:-padding]
+    return X_padded
+
+
+class ConvLayer:
+    def __init__(self, W, b, stride=1, padding=0):
+        self.W = np.array(W, dtype=np.float64)
+        self.b = np.array(b, dtype=np.float64)
+        self.stride = stride
+        self.padding = padding
+
+    def forward(self, X):
+        self.X = X
+        N, C, H, W = X.shape
+        out_channels, _, KH, KW = self.W.shape
+
+        self.col = im2col(X, KH, self.stride, self.padding)
+        W_reshaped = self.W.reshape(out_channels, -1)
+
+        out = self.col.dot(W_reshaped.T) + self.b
+        H_out = (H + 2 * self.padding - KH) // self.stride + 1
+        W_out = (W + 2 * self.padding - KW) // self.stride + 1
+        out = out.reshape(N, H_out, W_out, out_channels).transpose(0, 3, 1, 2)
+
+        self.W_reshaped = W_reshaped
+        return out
+
+    def backward(self, dOut):
+        N, C_out, H_out, W_out = dOut.shape
+        out_channels, in_channels, KH, KW = self.W.shape
+
+        dOut_reshaped = dOut.transpose(0, 2, 3, 1).reshape(-1, C_out)
+        self.db = np.sum(dOut_reshaped, axis=0)
+        self.dW = dOut_reshaped.T.dot(self.col).reshape(self.W.shape)
+
+        dCol = dOut_reshaped.dot(self.W_reshaped)
+        dX = col2im(dCol, self.X.shape, KH, self.stride, self.padding)
+
+        return dX
+
+
+class ReLULayer:
+    def forward(self, X):
+        self.X = X
+        return np.maximum(0, X)
+
+    def backward(self, dOut):
+        dX = dOut * (self.X > 0)
+        return dX
+
+
+class MaxPoolLayer:
+    # The original loops, with the output size taken from the stride so
+    # overlapping windows can be checked too
+    def __init__(self, pool_size=2, stride=2):
+        self.pool_size = pool_size
+        self.stride = stride
+
+    def forward(self, X):
+        self.X = X
+        N, C, H, W = X.shape
+        HH = (H - self.pool_size) // self.stride + 1
+        WW = (W - self.pool_size) // self.stride + 1
+
+        out = np.zeros((N, C, HH, WW))
+        self.max_indices = np.zeros((N, C, HH, WW, 2), dtype=int)
+
+        for n in range(N):
+            for c in range(C):
+                for i in range(HH):
+                    for j in range(WW):
+                        region = X[
+                            n,
+                            c,
+                            i * self.stride : i * self.stride + self.pool_size,
+                            j * self.stride : j * self.stride + self.pool_size,
+                        ]
+                        max_val = np.max(region)
+                        out[n, c, i, j] = max_val
+                        idx = np.unravel_index(np.argmax(region), region.shape)
+                        self.max_indices[n, c, i, j] = [
+                            idx[0] + i * self.stride,
+                            idx[1] + j * self.stride,
+                        ]
+
+        return out
+
+    def backward(self, dOut):
+        N, C, HH, WW = dOut.shape
+        dX = np.zeros_like(self.X)
+
+        for n in range(N):
+            for c in range(C):
+                for i in range(HH):
+                    for j in range(WW):
+                        max_i, max_j = self.max_indices[n, c, i, j]
+                        dX[n, c, max_i, max_j] += dOut[n, c, i, j]
+
+        return dX
+
+
+class FlattenLayer:
+    def forward(self, X):
+        self.X_shape = X.shape
+        N = X.shape[0]
+        return X.reshape(N, -1)
+
+    def backward(self, dOut):
+        return dOut.reshape(self.X_shape)
+
+
+class FullyConnectedLayer:
+    def __init__(self, W, b):
+        self.W = np.array(W, dtype=np.float64)
+        self.b = np.array(b, dtype=np.float64)
+
+    def forward(self, X):
+        self.X = X
+        return X.dot(self.W) + self.b
+
+    def backward(self, dOut):
+        dX = dOut.dot(self.W.T)
+        self.dW = self.X.T.dot(dOut)
+        self.db = np.sum(dOut, axis=0)
+        return dX
+
+
+class SoftmaxLayer:
+    def forward(self, X):
+        shift_X = X - np.max(X, axis=1, keepdims=True)
+        exp_X = np.exp(shift_X)
+        self.out = exp_X / np.sum(exp_X, axis=1, keepdims=True)
+        return self.out
+
+    def backward(self, dOut):
+        return dOut
+
+
+def softmax_cross_entropy(logits, y):
+    # Softmax, then the original loss and its gradient w.r.t. the logits.
+    # The original's log(out + 1e-9) is left out: it biases the loss by up
+    # to 1e-9 / p, and the fused loss being checked is exact
+    probs = SoftmaxLayer().forward(logits)
+    N = y.shape[0]
+    y_one_hot_vec = one_hot(y, probs.shape[1])
+    loss = -np.sum(y_one_hot_vec * np.log(probs)) / N
+    return loss, (probs - y_one_hot_vec) / N
+
+
+class ReferenceNetwork:
+    """
+    The reference layers wired like src.network.Network, taking their
+    weights from an existing Network so both compute the same function.
+    """
+
+    def __init__(self, net):
+        conv, _, pool, _, fc, _ = net.layers
+        self.layers = [
+            ConvLayer(conv.W, conv.b, conv.stride, conv.padding),
+            ReLULayer(),
+            MaxPoolLayer(pool.pool_size, pool.stride),
+            FlattenLayer(),
+            FullyConnectedLayer(fc.W, fc.b),
+        ]
+
+    def loss_and_backward(self, X, y):
+        out = np.asarray(X, dtype=np.float64)
+        for layer in self.layers:
+            out = layer.forward(out)
+        loss, dOut = softmax_cross_entropy(out, y)
+        for layer in reversed(self.layers):
+            dOut = layer.backward(dOut)
+        return loss
+
+    def gradients(self):
+        # (dW, db) pairs in Network.parameters() order
+        return [
+            getattr(layer, name)
+            for layer in self.layers
+            if hasattr(layer, "W")
+            for name in ("dW", "db")
+        ]
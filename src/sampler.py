@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class Sampler:
+    """
+    Sample order for one epoch at a time. new_epoch() refills `order`,
+    and batch i is order[i * batch_size : (i + 1) * batch_size]; keeping
+    the whole epoch in one array lets a checkpoint store it and resume
+    mid-epoch exactly. `rng` defaults to the global np.random state.
+    """
+
+    def __init__(self, num_samples, rng=None):
+        self.order = np.arange(num_samples)
+        self.rng = rng if rng is not None else np.random
+        # Size of the dataset the order indexes
+        self.num_rows = num_samples
+
+    def restore_order(self, order):
+        # A checkpointed order, refused unless it fits this sampler and dataset
+        order = np.array(order)
+        if (
+            order.shape != self.order.shape
+            or not np.issubdtype(order.dtype, np.integer)
+            or (order.size and (order.min() < 0 or order.max() >= self.num_rows))
+        ):
+            raise ValueError(
+                f"Saved sample order (length {order.size}) does not index this "
+                f"dataset of {self.num_rows} samples in epochs of {len(self)}"
+            )
+        self.order = order
+
+    def new_epoch(self):
+        pass
+
+    def __len__(self):
+        return len(self.order)
+
+
+class SequentialSampler(Sampler):
+    pass
+
+
+class ShuffledSampler(Sampler):
+    def new_epoch(self):
+        # Shuffled in place, so each epoch permutes the previous order
+        self.rng.shuffle(self.order)
+
+
+class WeightedSampler(Sampler):
+    """
+    Draws num_samples indices per epoch with replacement, index i with
+    probability proportional to weights[i].
+    """
+
+    def __init__(self, weights, num_samples=None, rng=None):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or np.any(weights < 0) or not weights.sum() > 0:
+            raise ValueError(
+                "weights must be a non-negative vector with a positive sum"
+            )
+        super().__init__(num_samples or len(weights), rng)
+        self.num_rows = len(weights)
+        self.probabilities = weights / weights.sum()
+
+    def new_epoch(self):
+        self.order[:] = self.rng.choice(
+            len(self.probabilities), len(self.order), p=self.probabilities
+        )
+
+
+class ClassBalancedSampler(WeightedSampler):
+    # Every class equally likely per draw, however rare it is in labels
+    def __init__(self, labels, num_samples=None, rng=None):
+        _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        super().__init__(1.0 / counts[inverse], num_samples, rng)
+
+
+SAMPLERS = {
+    "sequential": SequentialSampler,
+    "shuffle": ShuffledSampler,
+    "balanced": ClassBalancedSampler,
+}
+
+
+def make_sampler(name, labels, **kwargs):
+    """
+    Build a sampler over labels by name: "sequential", "shuffle" or
+    "balanced". WeightedSampler needs weights, so it is built directly.
+    """
+    if name not in SAMPLERS:
+        raise ValueError(
+            f"Unknown sampler {name!r}; expected one of {sorted(SAMPLERS)}"
+        )
+    if name == "balanced":
+        return ClassBalancedSampler(labels, **kwargs)
+    return SAMPLERS[name](len(labels), **kwargs)
+
+
+class BatchLoader:
+    """
+    Batches of (X, y) in a sampler's order, gathered into one reusable
+    pair of buffers: each batch is only valid until the next one is
+    produced. X may be an array or memory map (rows are copied as they
+    are) or an IdxDataset (uint8 rows are normalized while gathering),
+    so the dataset itself is never copied or reordered. Only full
+    batches are produced. transform(X_batch, y_batch, batch_index), such
+    as a src.augment.Augmenter, is applied in place after gathering.
+    """
+
+    def __init__(self, X, y, sampler, batch_size, dtype=np.float32, transform=None):
+        self.X = X
+        self.y = y
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.transform = transform
+        self.X_buffer = np.empty((batch_size,) + tuple(X.shape[1:]), dtype=dtype)
+        self.y_buffer = np.empty(batch_size, dtype=np.asarray(y[:1]).dtype)
+
+    @property
+    def num_batches(self):
+        return len(self.sampler) // self.batch_size
+
+    def gather(self, indices, X_out, y_out):
+        if hasattr(self.X, "batch"):
+            self.X.batch(indices, X_out)
+        else:
+            # mode="clip" skips the buffered copy that mode="raise" makes;
+            # orders are in range by construction or by restore_order
+            np.take(self.X, indices, axis=0, out=X_out, mode="clip")
+        np.take(self.y, indices, out=y_out, mode="clip")
+        return X_out, y_out
+
+    def batch_indices(self, i):
+        return self.sampler.order[i * self.batch_size : (i + 1) * self.batch_size]
+
+    def load(self, i, X_out, y_out):
+        # Batch i of the epoch into the given buffers, transformed
+        self.gather(self.batch_indices(i), X_out, y_out)
+        if self.transform is not None:
+            self.transform(X_out, y_out, i)
+        return X_out, y_out
+
+    def batches(self, start_batch=0):
+        # (i, X_batch, y_batch) for the rest of the current epoch
+        for i in range(start_batch, self.num_batches):
+            X_batch, y_batch = self.load(i, self.X_buffer, self.y_buffer)
+            yield i, X_batch, y_batch
@@ -0,0 +1,327 @@
+"""
+Micro-batching inference server for the trained Network, and a load
+generator to drive it.
+
+Wire format (all integers big-endian), any number of requests may be
+pipelined on one connection and responses can arrive out of order:
+
+    request:  uint32 request_id, uint8 k, 784 bytes of 28x28 uint8 pixels
+    response: uint32 request_id, uint8 k, k x uint8 class, k x float32 prob
+
+    python -m src.serve serve --checkpoint checkpoints --port 8765
+    python -m src.serve bench --port 8765 --connections 32 --requests 20000
+"""
+
+import argparse
+import asyncio
+import signal
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.data import normalize_into
+from src.network import Network
+
+IMAGE_SHAPE = (1, 28, 28)
+IMAGE_BYTES = 28 * 28
+HEADER = struct.Struct("!IB")
+REQUEST_BYTES = HEADER.size + IMAGE_BYTES
+
+
+def top_k(probs, k):
+    # Unordered top-k by partition, then sort just those k per row
+    k = min(k, probs.shape[1])
+    idx = np.argpartition(probs, -k, axis=1)[:, -k:]
+    top = np.take_along_axis(probs, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    return (
+        np.take_along_axis(idx, order, axis=1),
+        np.take_along_axis(top, order, axis=1),
+    )
+
+
+def encode_response(request_id, classes, probs):
+    return (
+        HEADER.pack(request_id, len(classes))
+        + classes.astype(np.uint8).tobytes()
+        + probs.astype(">f4").tobytes()
+    )
+
+
+class LatencyStats:
+    """
+    Request latencies (seconds) and batch sizes since the last reset,
+    summarised as p50/p99 and throughput.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.batch_sizes = []
+        self.start = time.perf_counter()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        n = len(self.latencies)
+        if n == 0:
+            return "no requests"
+        p50, p99 = np.percentile(self.latencies, [50, 99]) * 1e3
+        return (
+            f"{n} requests in {elapsed:.1f}s ({n / elapsed:.0f} req/s), "
+            f"p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+            f"mean batch {np.mean(self.batch_sizes):.1f}"
+        )
+
+
+class InferenceServer:
+    """
+    Accepts 28x28 uint8 images over TCP or a Unix socket and answers with
+    the top-k classes. Concurrent requests are gathered into one batch of
+    up to max_batch_size, waiting at most max_wait_us after the first one
+    arrives; each batch runs through Network.predict on a worker thread
+    so the event loop keeps accepting the next batch meanwhile.
+    """
+
+    def __init__(self, net, max_batch_size=64, max_wait_us=2000, report_every=10.0):
+        self.net = net
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1e6
+        self.report_every = report_every
+        self.stats = LatencyStats()
+        self.queue = None
+        # One inference thread: batches run back to back, never concurrently
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pixels = np.empty((max_batch_size,) + IMAGE_SHAPE, dtype=np.uint8)
+        self.inputs = np.empty(
+            (max_batch_size,) + IMAGE_SHAPE, dtype=net.policy.compute_dtype
+        )
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _run_batch(self, payloads, ks):
+        n = len(payloads)
+        for i, payload in enumerate(payloads):
+            self.pixels[i] = np.frombuffer(payload, dtype=np.uint8).reshape(IMAGE_SHAPE)
+        normalize_into(self.pixels[:n], self.inputs[:n])
+        probs = self.net.predict(self.inputs[:n])
+        classes, top = top_k(probs, max(ks))
+        return classes, top
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            payloads = [item[1] for item in batch]
+            ks = [item[2] for item in batch]
+            try:
+                classes, top = await loop.run_in_executor(
+                    self.executor, self._run_batch, payloads, ks
+                )
+            except Exception as e:
+                # The protocol has no error response: drop the connections
+                # of this batch's clients so they fail instead of waiting,
+                # and keep serving everyone else
+                print(f"[serve] batch of {len(batch)} failed: {e!r}", flush=True)
+                for *_, writer in batch:
+                    writer.close()
+                continue
+            now = time.perf_counter()
+            for i, (request_id, _, k, received, writer) in enumerate(batch):
+                if not writer.is_closing():
+                    writer.write(
+                        encode_response(request_id, classes[i, :k], top[i, :k])
+                    )
+                self.stats.latencies.append(now - received)
+            self.stats.batch_sizes.append(len(batch))
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            print(f"[serve] {self.stats.summary()}", flush=True)
+            self.stats.reset()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                frame = await reader.readexactly(REQUEST_BYTES)
+                received = time.perf_counter()
+                request_id, k = HEADER.unpack_from(frame)
+                await self.queue.put(
+                    (request_id, frame[HEADER.size :], max(1, k), received, writer)
+                )
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        self.queue = asyncio.Queue()
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self._handle, path=unix_path)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            where = f"{host}:{port}"
+        print(
+            f"Serving on {where} (max batch {self.max_batch_size}, "
+            f"max wait {self.max_wait * 1e6:.0f} us)",
+            flush=True,
+        )
+        tasks = [asyncio.create_task(self._batcher())]
+        if self.report_every:
+            tasks.append(asyncio.create_task(self._reporter()))
+        # SIGINT/SIGTERM stop the server cleanly and print the final stats
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:  # Windows event loops
+                pass
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            print(f"[serve] {self.stats.summary()}", flush=True)
+            self.executor.shutdown()
+
+
+async def _open(host, port, unix_path):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+
+async def _client(images, host, port, unix_path, num_requests, in_flight, k, latencies):
+    reader, writer = await _open(host, port, unix_path)
+    sent_at = {}
+    window = asyncio.Semaphore(in_flight)
+
+    async def receive():
+        for _ in range(num_requests):
+            header = await reader.readexactly(HEADER.size)
+            request_id, count = HEADER.unpack(header)
+            await reader.readexactly(count * 5)
+            latencies.append(time.perf_counter() - sent_at.pop(request_id))
+            window.release()
+
+    receiver = asyncio.create_task(receive())
+    for request_id in range(num_requests):
+        await window.acquire()
+        image = images[request_id % len(images)]
+        sent_at[request_id] = time.perf_counter()
+        writer.write(HEADER.pack(request_id, k) + image.tobytes())
+    await receiver
+    writer.close()
+
+
+async def run_load(
+    host="127.0.0.1",
+    port=8765,
+    unix_path=None,
+    connections=16,
+    requests=10000,
+    in_flight=4,
+    k=3,
+    images=None,
+):
+    """
+    Drive a running server from `connections` concurrent clients, each
+    keeping up to `in_flight` pipelined requests outstanding, and print
+    client-side throughput and p50/p99 latency.
+    """
+    if images is None:
+        images = np.random.RandomState(0).randint(
+            0, 256, size=(256, 28, 28), dtype=np.uint8
+        )
+    per_client = -(-requests // connections)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            _client(images, host, port, unix_path, per_client, in_flight, k, latencies)
+            for _ in range(connections)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    print(
+        f"{len(latencies)} requests from {connections} connections in "
+        f"{elapsed:.2f}s: {len(latencies) / elapsed:.0f} req/s, "
+        f"p50 {p50:.2f} ms, p99 {p99:.2f} ms"
+    )
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--unix", help="Unix socket path instead of TCP")
+
+    p = sub.choices["serve"]
+    p.add_argument("--checkpoint", default="checkpoints", help="checkpoint directory")
+    p.add_argument("--max-batch", type=int, default=64)
+    p.add_argument("--max-wait-us", type=int, default=2000)
+    p.add_argument("--report-every", type=float, default=10.0)
+
+    p = sub.choices["bench"]
+    p.add_argument("--connections", type=int, default=16)
+    p.add_argument("--requests", type=int, default=10000)
+    p.add_argument("--in-flight", type=int, default=4)
+    p.add_argument("-k", type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        from src.checkpoint import Checkpointer
+
+        net = Network()
+        path = Checkpointer(args.checkpoint).load_parameters(net)
+        print(
+            f"Loaded {path}" if path else "No checkpoint found; serving random weights"
+        )
+        server = InferenceServer(
+            net, args.max_batch, args.max_wait_us, args.report_every
+        )
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    else:
+        asyncio.run(
+            run_load(
+                args.host,
+                args.port,
+                args.unix,
+                args.connections,
+                args.requests,
+                args.in_flight,
+                args.k,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
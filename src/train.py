@@ -1,19 +1,14 @@
-import numpy as np
+import signal
+import time
 
+from src.evaluate import DEFAULT_BATCH_SIZE, Evaluator, count_correct, format_result
+from src.loader import PrefetchLoader
+from src.optim import Optimizer, make_optimizer
+from src.sampler import BatchLoader, Sampler, make_sampler
 
-def compute_accuracy(X, y, net, batch_size=100):
-    N = X.shape[0]
-    correct = 0
-    for start_idx in range(0, N, batch_size):
-        end_idx = start_idx + batch_size
-        X_batch = X[start_idx:end_idx]
-        y_batch = y[start_idx:end_idx]
 
-        out = net.forward(X_batch)
-        preds = np.argmax(out, axis=1)
-        correct += np.sum(preds == y_batch)
-
-    return correct / N
+def compute_accuracy(X, y, net, batch_size=DEFAULT_BATCH_SIZE):
+    return count_correct(net, X, y, batch_size) / X.shape[0]
 
 
 def train_network(
@@ -26,42 +21,193 @@ def train_network(
     batch_size=64,
     learning_rate=0.01,
     print_every=100,
+    num_threads=1,
+    blas_threads=None,
+    optimizer="sgd",
+    checkpoint_dir=None,
+    checkpoint_every=500,
+    resume=True,
+    profile=False,
+    trace_path=None,
+    trace_steps=20,
+    eval_subsample=None,
+    sampler="shuffle",
+    prefetch=2,
+    augment=None,
 ):
-    num_batches = X_train.shape[0] // batch_size
+    """
+    Mini-batch training loop. With checkpoint_dir set, state is saved in
+    the background every checkpoint_every batches and after each epoch,
+    training resumes from the latest checkpoint there (unless
+    resume=False), and SIGTERM saves a checkpoint before exiting.
 
-    for epoch in range(1, epochs + 1):
-        print(f"--- Epoch {epoch}/{epochs} ---")
+    profile=True prints per-layer timings every print_every batches;
+    trace_path additionally writes a Chrome trace of the first
+    trace_steps steps.
+
+    Training accuracy is a running count taken from the logits each step
+    already computes. With eval_subsample set, epochs before the last are
+    scored on a fixed stratified test subset of that size with a 95%
+    confidence interval; the last epoch always scores the full test set.
+
+    sampler is a src.sampler.Sampler or a name for make_sampler
+    ("sequential", "shuffle", "balanced"). Batches are gathered in its
+    order into one reused buffer; X_train may also be an IdxDataset.
+    With prefetch > 0 they are gathered on a background thread up to
+    that many batches ahead, and each epoch reports how long training
+    waited for data.
+
+    augment is a src.augment.Augmenter applied to every training batch
+    (on the prefetch thread when prefetching), seeded per epoch; each
+    epoch reports its throughput next to training's.
+    """
+    if not isinstance(sampler, Sampler):
+        sampler = make_sampler(sampler, y_train)
+    loader = BatchLoader(X_train, y_train, sampler, batch_size, transform=augment)
+    if prefetch:
+        loader = PrefetchLoader(loader, prefetch)
+    num_batches = loader.num_batches
+    batch_shape = loader.X_buffer.shape
+
+    # Bind the parameters to flat buffers before any replicas are made
+    if not isinstance(optimizer, Optimizer):
+        optimizer = make_optimizer(optimizer, net, learning_rate)
+
+    # Enabled before replicas are made, so they share the profiler
+    profiler = None
+    if profile or trace_path:
+        profiler = net.enable_profiling()
+        if trace_path:
+            profiler.start_trace(trace_path, trace_steps)
+
+    # Every training batch has the same shape, so plan its buffers once
+    if num_threads > 1:
+        from src.parallel import ShardedExecutor
 
-        indices = np.arange(X_train.shape[0])
-        np.random.shuffle(indices)
-        X_train = X_train[indices]
-        y_train = y_train[indices]
+        executor = ShardedExecutor(net, num_threads, blas_threads)
+        executor.compile(batch_shape)
+        step = executor.loss_and_backward
+        print(f"Sharding each batch across {num_threads} threads")
+    else:
+        executor = None
+        plan = net.compile(batch_shape)
+        step = net.loss_and_backward
+        print(f"Activation memory plan: {plan.summary()}")
 
-        epoch_loss = 0.0
-        for i in range(num_batches):
-            start = i * batch_size
-            end = start + batch_size
-            X_batch = X_train[start:end]
-            y_batch = y_train[start:end]
+    evaluator = Evaluator(X_test, y_test, eval_subsample)
+    final_evaluator = Evaluator(X_test, y_test) if eval_subsample else evaluator
+    source = executor if executor is not None else net
 
-            loss = net.loss_and_backward(X_batch, y_batch)
+    # The sampler's order persists across epochs (a shuffled epoch permutes
+    # the last one), so a checkpoint can record it and resume mid-epoch
+    first_epoch, first_batch, epoch_loss, epoch_correct = 1, 0, 0.0, 0
+    checkpointer = terminate = None
+    if checkpoint_dir is not None:
+        from src.checkpoint import Checkpointer, TerminationFlag, resume_position
+
+        checkpointer = Checkpointer(checkpoint_dir)
+        state = checkpointer.load(optimizer) if resume else None
+        if state is not None:
+            first_epoch, first_batch = resume_position(state, batch_size)
+            epoch_loss = state["extra"].get("epoch_loss", 0.0)
+            epoch_correct = state["extra"].get("epoch_correct", 0)
+            if state["order"] is not None:
+                sampler.restore_order(state["order"])
+            if first_epoch > epochs:
+                print(
+                    f"{state['path']} is the end of a completed {epochs}-epoch "
+                    "run; nothing to resume (start fresh with resume=False)"
+                )
+            else:
+                print(
+                    f"Resuming from {state['path']} at epoch {first_epoch}, "
+                    f"batch {first_batch}"
+                )
+        terminate = TerminationFlag()
+
+    def save_checkpoint(epoch, batch, block=False):
+        checkpointer.save(
+            optimizer,
+            epoch,
+            batch,
+            sampler.order,
+            {
+                "epoch_loss": float(epoch_loss),
+                "epoch_correct": epoch_correct,
+                "batch_size": batch_size,
+            },
+            block=block,
+        )
+
+    for epoch in range(first_epoch, epochs + 1):
+        print(f"--- Epoch {epoch}/{epochs} ---")
+
+        start_batch = first_batch if epoch == first_epoch else 0
+        if start_batch == 0:
+            sampler.new_epoch()
+            epoch_loss, epoch_correct = 0.0, 0
+        if prefetch:
+            loader.reset_stats()
+        if augment is not None:
+            augment.set_epoch(epoch)
+            augment.reset_stats()
+        epoch_start = time.perf_counter()
+
+        for i, X_batch, y_batch in loader.batches(start_batch):
+            loss = step(X_batch, y_batch)
             epoch_loss += loss
+            epoch_correct += source.last_correct
 
-            # Parameter update (SGD)
-            for layer in net.layers:
-                if hasattr(layer, "W"):
-                    layer.W -= learning_rate * layer.dW
-                if hasattr(layer, "b"):
-                    layer.b -= learning_rate * layer.db
+            optimizer.step()
+            if profiler is not None:
+                profiler.end_step()
 
             # Print progress
             if (i + 1) % print_every == 0:
                 print(f"Epoch {epoch}, Batch {i+1}/{num_batches}, Loss: {loss:.4f}")
+                if profile:
+                    print(profiler.summary())
+
+            if checkpointer is not None:
+                if terminate:
+                    print("SIGTERM received; saving checkpoint before exit")
+                    save_checkpoint(epoch, i + 1, block=True)
+                    checkpointer.close()
+                    raise SystemExit(128 + signal.SIGTERM)
+                if checkpoint_every and (i + 1) % checkpoint_every == 0:
+                    save_checkpoint(epoch, i + 1)
 
         avg_loss = epoch_loss / num_batches
-        print(f"Epoch {epoch} completed. Average Loss: {avg_loss:.4f}")
+        train_acc = epoch_correct / (num_batches * batch_size)
+        print(
+            f"Epoch {epoch} completed. Average Loss: {avg_loss:.4f}, "
+            f"Running Train Accuracy: {train_acc * 100:.2f}%"
+        )
+        elapsed = time.perf_counter() - epoch_start
+        if prefetch:
+            stats = loader.stats()
+            print(
+                f"Data wait: {stats['wait_s']:.2f}s "
+                f"({stats['wait_ms_per_batch']:.2f} ms/batch, "
+                f"{stats['wait_s'] / elapsed * 100:.1f}% of the epoch)"
+            )
+        if augment is not None:
+            trained = (num_batches - start_batch) * batch_size / elapsed
+            print(
+                f"Augmentation: {augment.stats()['images_per_s']:.0f} images/s "
+                f"on {augment.num_workers} worker(s); training {trained:.0f} images/s"
+            )
+        if checkpointer is not None:
+            save_checkpoint(epoch + 1, 0)
 
-        test_acc = compute_accuracy(X_test, y_test, net)
-        print(f"Test Accuracy after Epoch {epoch}: {test_acc * 100:.2f}%\n")
+        result = (final_evaluator if epoch == epochs else evaluator).evaluate(net)
+        print(f"Test Accuracy after Epoch {epoch}: {format_result(result)}\n")
 
+    if executor is not None:
+        executor.close()
+    if profiler is not None:
+        net.disable_profiling()
+    if checkpointer is not None:
+        terminate.restore()
+        checkpointer.close()
     print("Training completed.")